@@ -0,0 +1,242 @@
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import statistics
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Iterator, List, Optional
+from form_filler import FormFiller, TARGET_URL
+from form_manifest import extract_manifest
+from llm_client import configure_shared_client, shared_client
+from llm_mapper import LLMMapper
+from mapping_cache import MappingCache
+from navigation import BLOCKED_RESOURCE_TYPES, Navigator, ResponseCache
+from instrumentation import configure_logging, tracer
+
+logger = logging.getLogger(__name__)
+
+_BOOL_STRINGS = {"true": True, "false": False}
+
+
+def _unflatten(row: Dict[str, str]) -> Dict:
+    # CSV columns are dotted paths ("attorney.family_name", "part6.additional_info.entries_section_2.0.page_number").
+    record = {}
+    for column, value in row.items():
+        if column is None or column == "":
+            continue
+        keys = column.split(".")
+        node = record
+        for key, next_key in zip(keys, keys[1:]):
+            child = [] if next_key.isdigit() else {}
+            if isinstance(node, list):
+                key = int(key)
+                while len(node) <= key:
+                    node.append(None)
+                if node[key] is None:
+                    node[key] = child
+                node = node[key]
+            else:
+                node = node.setdefault(key, child)
+        last = keys[-1]
+        value = _BOOL_STRINGS.get(value.strip().lower(), value) if isinstance(value, str) else value
+        if isinstance(node, list):
+            last = int(last)
+            while len(node) <= last:
+                node.append(None)
+        node[last] = value
+    return record
+
+
+def read_records(path: str) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8", newline="") as fh:
+        if path.lower().endswith(".csv"):
+            for row in csv.DictReader(fh):
+                yield _unflatten(row)
+        else:
+            for line in fh:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class PagePool:
+    """A fixed set of reusable browser contexts, one page each, shared by all records."""
+
+    def __init__(self, browser, size: int):
+        self.browser = browser
+        self.size = size
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._contexts = []
+
+    async def start(self):
+        for _ in range(self.size):
+            context = await self.browser.new_context()
+            self._contexts.append(context)
+            self._idle.put_nowait(await context.new_page())
+
+    async def close(self):
+        for context in self._contexts:
+            await context.close()
+
+    @asynccontextmanager
+    async def page(self):
+        page = await self._idle.get()
+        try:
+            yield page
+        finally:
+            self._idle.put_nowait(page)
+
+
+def _summarize(results: List[Dict], wall: float, concurrency: int) -> Dict:
+    phases = {}
+    for result in results:
+        for phase, seconds in result.get("timings", {}).items():
+            phases.setdefault(phase, []).append(seconds)
+    summary = {
+        "records": len(results),
+        "ok": sum(1 for r in results if r["status"] == "ok"),
+        "failed": sum(1 for r in results if r["status"] != "ok"),
+        "complete": sum(1 for r in results if (r.get("verification") or {}).get("complete")),
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 3),
+        "records_per_second": round(len(results) / wall, 3) if wall else 0.0,
+        "phases": {},
+    }
+    for phase, values in phases.items():
+        values.sort()
+        summary["phases"][phase] = {
+            "mean": round(statistics.mean(values), 4),
+            "p50": round(values[len(values) // 2], 4),
+            "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 4),
+        }
+    return summary
+
+
+class BatchRunner:
+
+    def __init__(self, target_url: str = TARGET_URL, concurrency: int = 4,
+                 cache: Optional[MappingCache] = None, batched: bool = True, streaming: bool = False,
+                 section_parallel: bool = False, mapper: Optional[LLMMapper] = None,
+                 navigator: Optional[Navigator] = None, verify_retries: Optional[int] = 2):
+        self.target_url = target_url
+        self.concurrency = concurrency
+        self.cache = cache if cache is not None else MappingCache()
+        self.batched = batched
+        self.streaming = streaming
+        self.section_parallel = section_parallel
+        self.mapper = mapper
+        self.verify_retries = verify_retries
+        # Headless batches skip images, fonts and stylesheets and fetch the form document once.
+        self.navigator = navigator if navigator is not None else Navigator(response_cache=ResponseCache())
+
+    async def _run_one(self, pool: PagePool, record_id, record: Dict,
+                       expected_manifest: Optional[List[Dict]]) -> Dict:
+        filler = FormFiller(self.target_url, record, cache=self.cache, batched=self.batched,
+                            streaming=self.streaming, section_parallel=self.section_parallel,
+                            mapper=self.mapper, navigator=self.navigator,
+                            verify_retries=self.verify_retries)
+        async with pool.page() as page:
+            try:
+                report = await filler.fill_page(page, expected_manifest)
+            except Exception as e:
+                logger.error("❌ [Batch] Record %s failed: %s", record_id, e)
+                report = {"status": "error", "error": str(e), "timings": {}, "unfilled": []}
+        report["record"] = record_id
+        return report
+
+    async def run(self, records: List[Dict], results_path: Optional[str] = None) -> Dict:
+        from playwright.async_api import async_playwright
+
+        started = time.perf_counter()
+        results = []
+        out = open(results_path, "w", encoding="utf-8") if results_path else None
+        try:
+            async with async_playwright() as p:
+                browser = await p.chromium.launch(headless=True)
+                pool = PagePool(browser, max(1, min(self.concurrency, len(records))))
+                await pool.start()
+                # Probe the form once so every record can start its mapping while its page loads.
+                async with pool.page() as page:
+                    await FormFiller(self.target_url, {}, cache=self.cache, navigator=self.navigator).open(page)
+                    expected_manifest = (await extract_manifest(page))["fields"]
+                tasks = [
+                    asyncio.create_task(
+                        self._run_one(pool, record.get("id", i), record, expected_manifest))
+                    for i, record in enumerate(records)
+                ]
+                for finished in asyncio.as_completed(tasks):
+                    result = await finished
+                    results.append(result)
+                    if out:
+                        out.write(json.dumps(result) + "\n")
+                        out.flush()
+                await pool.close()
+                await browser.close()
+        finally:
+            if out:
+                out.close()
+        summary = _summarize(results, time.perf_counter() - started, self.concurrency)
+        summary["cache"] = self.cache.stats
+        summary["navigation"] = self.navigator.stats
+        summary["llm"] = (self.mapper.client if self.mapper is not None else shared_client()).metrics
+        if self.mapper is not None:
+            summary["tiers"] = self.mapper.tier_stats.report()
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the form for every record in a JSONL or CSV file.")
+    parser.add_argument("records", help="JSONL (one record per line) or CSV with dotted column names")
+    parser.add_argument("--url", default=TARGET_URL)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--results", default="batch_results.jsonl")
+    parser.add_argument("--summary", default="batch_summary.json")
+    parser.add_argument("--per-field", action="store_true", help="fill field by field instead of one batched plan")
+    parser.add_argument("--stream", action="store_true", help="fill mappings while the LLM response streams")
+    parser.add_argument("--by-section", action="store_true", help="one concurrent LLM call per form section")
+    parser.add_argument("--block", default=",".join(BLOCKED_RESOURCE_TYPES),
+                        help="comma-separated resource types to abort; empty to load everything")
+    parser.add_argument("--no-page-cache", action="store_true", help="fetch the form page for every record")
+    parser.add_argument("--har", metavar="PATH", help="replay the form page from a HAR file")
+    parser.add_argument("--har-update", action="store_true", help="record the HAR file instead of replaying it")
+    parser.add_argument("--retries", type=int, default=2,
+                        help="rounds of re-filling fields that read back wrong; -1 skips verification")
+    parser.add_argument("--model", default="gpt-4o", help="model for full mappings and escalations")
+    parser.add_argument("--fast-model", help="try this cheaper model first; escalate only fields that fail validation")
+    parser.add_argument("--rpm", type=float, default=500, help="LLM requests per minute across all records")
+    parser.add_argument("--tpm", type=float, default=30000, help="LLM tokens per minute across all records")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="LLM calls in flight at once")
+    parser.add_argument("--llm-base-url", help="OpenAI-compatible endpoint, e.g. a local llm_stub_server.py")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="record spans and token usage; .jsonl for JSON lines, otherwise a Chrome trace")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+    if args.profile:
+        tracer.enable()
+
+    configure_shared_client(requests_per_minute=args.rpm, tokens_per_minute=args.tpm,
+                            max_concurrency=args.llm_concurrency, base_url=args.llm_base_url)
+    records = list(read_records(args.records))
+    navigator = Navigator(block_resources=[t for t in args.block.split(",") if t],
+                          response_cache=None if args.no_page_cache else ResponseCache(),
+                          har_path=args.har, har_update=args.har_update)
+    # One mapper for the whole batch so the per-tier statistics cover every record.
+    mapper = LLMMapper(model_name=args.model, fast_model=args.fast_model)
+    runner = BatchRunner(args.url, concurrency=args.concurrency, batched=not args.per_field,
+                         streaming=args.stream, section_parallel=args.by_section, mapper=mapper, navigator=navigator,
+                         verify_retries=None if args.retries < 0 else args.retries)
+    summary = asyncio.run(runner.run(records, args.results))
+    if args.profile:
+        summary["trace"] = tracer.summary()
+        tracer.export(args.profile)
+    with open(args.summary, "w", encoding="utf-8") as fh:
+        json.dump(summary, fh, indent=2)
+    print(f"\n📊 {summary['ok']}/{summary['records']} records ok ({summary['complete']} verified complete) "
+          f"in {summary['wall_seconds']}s "
+          f"({summary['records_per_second']} records/s)")
+
+
+if __name__ == "__main__":
+    main()
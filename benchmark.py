@@ -0,0 +1,373 @@
+import argparse
+import asyncio
+import copy
+import functools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+from playwright.async_api import async_playwright
+from batch_runner import BatchRunner
+from data import mock_data_all_fields
+from form_filler import FormFiller
+from form_manifest import estimate_tokens
+from instrumentation import configure_logging
+from llm_client import LLMClient
+from llm_mapper import LLMMapper
+from llm_stub_server import StubState, pick_response, serve_stub
+from mapping_cache import MappingCache
+from navigation import BLOCKED_RESOURCE_TYPES, Navigator, ResponseCache
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(ROOT, "bench_fixtures")
+DEFAULT_BASELINE = os.path.join(FIXTURE_DIR, "baseline.json")
+
+# Modules a cache-served fill should never need to import.
+HEAVY_MODULES = ("langchain_core", "langchain_openai", "openai", "pydantic", "httpx", "dotenv")
+
+# Runs in a fresh interpreter with no API key: times the imports, the browser launch and one
+# fill whose mapping is already in the cache at argv[2], then prints the timings as JSON.
+STARTUP_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import asyncio
+from form_filler import FormFiller
+from mapping_cache import MappingCache
+imported = time.perf_counter()
+heavy = %r
+loaded_at_import = [name for name in heavy if name in sys.modules]
+
+async def first_fill():
+    from playwright.async_api import async_playwright
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        page = await browser.new_page()
+        launched = time.perf_counter()
+        cache = MappingCache(sys.argv[2])
+        report = await FormFiller(sys.argv[1], json.loads(sys.argv[3]), cache=cache).fill_page(page)
+        filled = time.perf_counter()
+        await browser.close()
+        return launched, filled, report["status"], cache.stats["hits"]
+
+launched, filled, status, hits = asyncio.run(first_fill())
+print(json.dumps({
+    "import_seconds": imported - started,
+    "launch_seconds": launched - imported,
+    "first_fill_seconds": filled - launched,
+    "status": status,
+    "cache_hits": hits,
+    "loaded_at_import": loaded_at_import,
+    "loaded_after_fill": [name for name in heavy if name in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_fixtures(directory: str = FIXTURE_DIR):
+    handler = functools.partial(_QuietHandler, directory=directory)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/form.html"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class _ReplayMessage:
+
+    def __init__(self, content: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+        self.content = content
+        self.usage_metadata = {"input_tokens": prompt_tokens, "output_tokens": completion_tokens}
+
+
+class ReplayChatModel:
+    """
+    Stands in for ChatOpenAI: answers ainvoke()/astream() with a recorded response after a
+    configurable delay, chosen the same way as llm_stub_server does. Streams deliver the first chunk after first_chunk_fraction of the latency and
+    spread the rest evenly.
+    """
+
+    def __init__(self, responses: Dict[str, List[Dict]], latency: float = 1.0,
+                 chunk_chars: int = 40, first_chunk_fraction: float = 0.2):
+        self.responses = responses
+        self.latency = latency
+        self.chunk_chars = chunk_chars
+        self.first_chunk_fraction = first_chunk_fraction
+        self.calls = 0
+
+    def _pick(self, messages) -> str:
+        return pick_response(self.responses, str(messages[-1].content))
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        content = self._pick(messages)
+        await asyncio.sleep(self.latency)
+        prompt_tokens = estimate_tokens("".join(str(m.content) for m in messages))
+        return _ReplayMessage(content, prompt_tokens, estimate_tokens(content))
+
+    async def astream(self, messages):
+        self.calls += 1
+        content = self._pick(messages)
+        chunks = [content[i:i + self.chunk_chars] for i in range(0, len(content), self.chunk_chars)]
+        await asyncio.sleep(self.latency * self.first_chunk_fraction)
+        delay = self.latency * (1 - self.first_chunk_fraction) / max(1, len(chunks) - 1)
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(delay)
+            yield _ReplayMessage(chunk)
+
+
+class ReplayLLMMapper(LLMMapper):
+
+    def __init__(self, responses: Dict[str, List[Dict]], latency: float = 1.0, **kwargs):
+        kwargs.setdefault("client", LLMClient())
+        super().__init__(model_name="replay", **kwargs)
+        self.model = ReplayChatModel(responses, latency)
+
+    def _chat_model(self, model_name=None):
+        return self.model
+
+
+def load_responses(path: str = os.path.join(FIXTURE_DIR, "llm_responses.json")) -> Dict[str, List[Dict]]:
+    with open(path, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def _describe(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    return {
+        "n": len(ordered),
+        "mean": round(statistics.mean(ordered), 4),
+        "p50": round(ordered[len(ordered) // 2], 4),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+        "min": round(ordered[0], 4),
+    }
+
+
+def _cache(enabled: bool) -> MappingCache:
+    # In-memory only; with caching off every put is evicted straight away.
+    return MappingCache(path=None, max_entries=256 if enabled else 0)
+
+
+async def bench_single(url: str, mapper: LLMMapper, repetitions: int, use_cache: bool,
+                       filler_options: Dict) -> Dict:
+    cache = _cache(use_cache)
+    end_to_end, phases = [], {}
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        page = await (await browser.new_context()).new_page()
+        for _ in range(repetitions):
+            filler = FormFiller(url, copy.deepcopy(mock_data_all_fields), cache=cache, mapper=mapper,
+                                **filler_options)
+            started = time.perf_counter()
+            report = await filler.fill_page(page)
+            end_to_end.append(time.perf_counter() - started)
+            for phase, seconds in report["timings"].items():
+                phases.setdefault(phase, []).append(seconds)
+        await browser.close()
+    return {
+        "end_to_end": _describe(end_to_end),
+        "phases": {phase: _describe(values) for phase, values in phases.items()},
+    }
+
+
+async def bench_batch(url: str, mapper: LLMMapper, repetitions: int, batch_size: int, concurrency: int,
+                      use_cache: bool, filler_options: Dict) -> Dict:
+    throughput, wall, navigate = [], [], []
+    for _ in range(repetitions):
+        runner = BatchRunner(url, concurrency=concurrency, cache=_cache(use_cache), mapper=mapper,
+                             **filler_options)
+        records = [dict(copy.deepcopy(mock_data_all_fields), id=i) for i in range(batch_size)]
+        summary = await runner.run(records)
+        throughput.append(summary["records_per_second"])
+        wall.append(summary["wall_seconds"])
+        navigate.append(summary["phases"]["navigate"]["p50"])
+    return {
+        "records_per_second": _describe(throughput),
+        "wall_seconds": _describe(wall),
+        "navigate_p50": _describe(navigate),
+    }
+
+
+async def bench_startup(url: str, responses: Dict[str, List[Dict]], repetitions: int) -> Dict:
+    """
+    Cold-start cost of a short-lived worker: a new interpreter without OPENAI_API_KEY imports
+    the filler and fills one record straight from a mapping cache warmed by this process.
+    """
+    record = copy.deepcopy(mock_data_all_fields)
+    env = {key: value for key, value in os.environ.items() if key != "OPENAI_API_KEY"}
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, "mapping_cache.json")
+        warm = MappingCache(cache_path)
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True)
+            page = await browser.new_page()
+            await FormFiller(url, copy.deepcopy(record), cache=warm,
+                             mapper=ReplayLLMMapper(responses, latency=0)).fill_page(page)
+            await browser.close()
+        # Without an entry the probe would call the real model, which has no key.
+        if not warm.stats["entries"]:
+            raise RuntimeError("warm-up fill stored no mapping; the startup probe would miss the cache")
+        for _ in range(repetitions):
+            started = time.perf_counter()
+            proc = await asyncio.to_thread(
+                subprocess.run, [sys.executable, "-c", STARTUP_PROBE, url, cache_path, json.dumps(record)],
+                cwd=ROOT, env=env, capture_output=True, text=True)
+            process_seconds = time.perf_counter() - started
+            if proc.returncode != 0:
+                raise RuntimeError(f"startup probe failed:\n{proc.stderr[-2000:]}")
+            run = json.loads(proc.stdout.strip().splitlines()[-1])
+            runs.append(dict(run, process_seconds=process_seconds))
+    return {
+        "import_seconds": _describe([run["import_seconds"] for run in runs]),
+        "launch_seconds": _describe([run["launch_seconds"] for run in runs]),
+        "first_fill_seconds": _describe([run["first_fill_seconds"] for run in runs]),
+        "process_seconds": _describe([run["process_seconds"] for run in runs]),
+        "served_from_cache": all(run["status"] == "ok" and run["cache_hits"] for run in runs),
+        "loaded_at_import": runs[-1]["loaded_at_import"],
+        "loaded_after_fill": runs[-1]["loaded_after_fill"],
+    }
+
+
+def _metrics(results: Dict) -> Dict[str, Tuple[float, bool]]:
+    # (name, value, higher_is_better) for everything worth comparing against a baseline.
+    metrics = {}
+    if "single" in results:
+        metrics["single.end_to_end.p50"] = (results["single"]["end_to_end"]["p50"], False)
+        for phase, stats in results["single"]["phases"].items():
+            metrics[f"single.{phase}.p50"] = (stats["p50"], False)
+    if "batch" in results:
+        metrics["batch.records_per_second.mean"] = (results["batch"]["records_per_second"]["mean"], True)
+        if "navigate_p50" in results["batch"]:
+            metrics["batch.navigate_p50.mean"] = (results["batch"]["navigate_p50"]["mean"], False)
+    if "startup" in results:
+        for name in ("import_seconds", "first_fill_seconds", "process_seconds"):
+            metrics[f"startup.{name}.p50"] = (results["startup"][name]["p50"], False)
+    return metrics
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    regressions = []
+    current = _metrics(results)
+    for name, (old, higher_is_better) in _metrics(baseline).items():
+        if name not in current or not old:
+            continue
+        new = current[name][0]
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = "REGRESSION" if worse > tolerance else "ok"
+        print(f"  {name:<40} {old:>10.4f} -> {new:>10.4f} ({change:+.1%}) {flag}")
+        if worse > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+async def run_benchmark(args) -> Dict:
+    responses = load_responses()
+    filler_options = {
+        "batched": not args.per_field,
+        "streaming": args.stream,
+        "section_parallel": args.by_section,
+        "navigator": Navigator(block_resources=() if args.no_block else BLOCKED_RESOURCE_TYPES,
+                               response_cache=ResponseCache() if args.page_cache else None),
+    }
+    results = {"config": dict(vars(args))}
+    stub = StubState(responses, args.stub_rpm, args.llm_latency) if args.stub_llm else None
+    with serve_fixtures() as url, (serve_stub(stub) if stub else nullcontext()) as stub_url:
+        def make_mapper() -> LLMMapper:
+            # --stub-llm goes through the real HTTP client, limiter and retries against a local stub.
+            if stub_url:
+                return LLMMapper(client=LLMClient(base_url=stub_url, requests_per_minute=args.client_rpm),
+                                 fast_model=args.fast_model)
+            return ReplayLLMMapper(responses, latency=args.llm_latency, fast_model=args.fast_model)
+
+        if args.mode in ("single", "all"):
+            mapper = make_mapper()
+            results["single"] = await bench_single(url, mapper, args.repetitions, args.cache, filler_options)
+            results["single"]["llm_client"] = mapper.client.metrics
+            results["single"]["tiers"] = mapper.tier_stats.report()
+        if args.mode in ("batch", "all"):
+            mapper = make_mapper()
+            results["batch"] = await bench_batch(url, mapper, args.repetitions, args.batch_size,
+                                                 args.concurrency, args.cache, filler_options)
+            results["batch"]["llm_client"] = mapper.client.metrics
+            results["batch"]["tiers"] = mapper.tier_stats.report()
+        if args.mode in ("startup", "all"):
+            results["startup"] = await bench_startup(url, responses, args.repetitions)
+        if stub:
+            results["stub"] = dict(stub.counters)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark against a local form snapshot and a replayed LLM.")
+    parser.add_argument("--mode", choices=("single", "batch", "startup", "all"), default="all")
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="seconds per replayed LLM call")
+    parser.add_argument("--stub-llm", action="store_true",
+                        help="call a local OpenAI-compatible stub over HTTP instead of replaying in-process")
+    parser.add_argument("--stub-rpm", type=int, default=600, help="requests per minute the stub allows")
+    parser.add_argument("--client-rpm", type=float, default=500, help="requests per minute the client allows itself")
+    parser.add_argument("--fast-model", help="route through this model first and escalate failures")
+    parser.add_argument("--cache", action="store_true", help="let the mapping cache serve repeat records")
+    parser.add_argument("--per-field", action="store_true")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--by-section", action="store_true")
+    parser.add_argument("--no-block", action="store_true", help="load images, fonts and stylesheets")
+    parser.add_argument("--page-cache", action="store_true", help="serve the form document from memory")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--no-compare", action="store_true", help="only measure; do not require a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative slowdown before failing")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    results = asyncio.run(run_benchmark(args))
+    print(json.dumps({key: value for key, value in results.items() if key != "config"}, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+        print(f"📌 Baseline saved to {args.baseline}")
+        return
+    if args.no_compare:
+        return
+    if not os.path.exists(args.baseline):
+        # A missing baseline must not look like a clean run.
+        print(f"❌ No baseline at {args.baseline}; record one with --save-baseline or pass --no-compare.")
+        sys.exit(2)
+    with open(args.baseline, "r", encoding="utf-8") as fh:
+        baseline = json.load(fh)
+    print(f"\n📏 Compared with {args.baseline} (tolerance {args.tolerance:.0%}):")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+    print("✅ No regressions.")
+
+
+if __name__ == "__main__":
+    main()
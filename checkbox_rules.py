@@ -0,0 +1,135 @@
+import copy
+from typing import Dict, List, Optional, Tuple
+
+from dom_index import normalize_label
+from field_mapping import FieldMapping
+
+_TRUTHY = {"yes", "y", "true", "1", "on"}
+
+
+def _flag(value) -> Optional[str]:
+    if isinstance(value, bool):
+        return "yes" if value else ""
+    return "yes" if str(value).strip().lower() in _TRUTHY else ""
+
+
+def _am_or_am_not(value) -> Optional[str]:
+    normalized = "yes" if value is True else "no" if value is False else str(value).strip().lower()
+    return {"yes": "am", "no": "am not"}.get(normalized)
+
+
+def _choice(value) -> Optional[str]:
+    return str(value).strip() if value else ""
+
+
+def _unless_no(value) -> Optional[str]:
+    return "" if str(value).strip().upper() == "N" else "yes"
+
+
+# The checkbox rules the LLM prompt used to spell out, one row per form field:
+# (output section, form label, data path, transform). A transform returning None means
+# the data value is outside what the rule understands and the field is left to the LLM.
+CHECKBOX_RULES = [
+    ("attorney",
+     "1.a. I am an attorney eligible to practice law in, and a member in good standing of, the bar of the "
+     "highest courts of the following jurisdictions. If you need extra space to complete this section, use "
+     "the space provided in Part 6. Additional Information.",
+     ("attorney", "attorney_eligible"), _flag),
+    ("attorney", "1.c. I (select only one box)", ("attorney", "subject_to_restrictions"), _am_or_am_not),
+    ("attorney",
+     "2.a. I am an authorized representative of the following qualified nonprofit religious, charitable, "
+     "social service, or similar organization.",
+     ("attorney", "is_nonprofit_rep"), _flag),
+    ("attorney", "3. I am associated with", ("attorney", "associated_with_student"), _flag),
+    ("attorney", "1.a. Administrative Case", ("attorney", "administrative_case"), _flag),
+    ("attorney", "2.a. Civil Case", ("attorney", "civil_case"), _flag),
+    ("attorney", "3.a. Other Legal Matter", ("attorney", "other_legal"), _flag),
+    ("client",
+     "5. I enter my appearance as an attorney or accredited representative at the request of the "
+     "(select only one box):",
+     ("attorney", "client_type"), _choice),
+    ("client",
+     "1.a. I request that all original notices on an application or petition be sent to the business "
+     "address of my attorney or representative as listed in this form.",
+     ("client", "send_notices_to_attorney"), _flag),
+    ("client",
+     "1.b. I request that any important documents that I receive be sent to the business address of my "
+     "attorney or representative.",
+     ("client", "send_documents_to_attorney"), _flag),
+    ("client", "1.c. I request that important documentation be sent to me at my mailing address.",
+     ("client", "send_documents_to_client"), _unless_no),
+]
+
+# Shorter labels are compared by prefix so a form that trims or extends the wording still matches.
+_MIN_PREFIX = 12
+
+
+def _same_label(a: str, b: str) -> bool:
+    a, b = normalize_label(a), normalize_label(b)
+    if not a or not b:
+        return False
+    if a == b:
+        return True
+    shorter, longer = sorted((a, b), key=len)
+    return len(shorter) >= _MIN_PREFIX and longer.startswith(shorter)
+
+
+def _on_form(label: str, manifest: List[Dict]) -> bool:
+    # Rules only decide checkboxes and radios, matched by their own label or their group's.
+    return any(field.get("type") in ("checkbox", "radio")
+               and (_same_label(field["label"], label) or _same_label(field.get("group", ""), label))
+               for field in manifest)
+
+
+class RuleEngine:
+    """Evaluates CHECKBOX_RULES locally so the LLM only sees what the rules cannot decide."""
+
+    def __init__(self, rules: List[Tuple] = None):
+        self.rules = CHECKBOX_RULES if rules is None else rules
+
+    def resolve(self, data: Dict, manifest: Optional[List[Dict]] = None) -> Tuple[List[FieldMapping], List[Tuple]]:
+        # With a manifest, rules for fields the form does not have are not evaluated.
+        mappings, consumed = [], []
+        for section, label, path, transform in self.rules:
+            if manifest is not None and not _on_form(label, manifest):
+                continue
+            node = data
+            for key in path:
+                node = node.get(key) if isinstance(node, dict) else None
+            if node is None:
+                continue
+            value = transform(node)
+            if value is None:
+                continue
+            mappings.append(FieldMapping(section=section, label=label, value=value))
+            consumed.append(path)
+        return mappings, consumed
+
+    def split(self, manifest: List[Dict], data: Dict) -> Tuple[List[FieldMapping], List[Dict], Dict]:
+        """
+        Return the locally resolved mappings plus the manifest and data that still need the LLM:
+        only rules for checkboxes and radios on this form are evaluated, the fields they resolved
+        are dropped from the manifest, and the data keys those rules read are dropped from the
+        data. Text and select controls always stay, even when they share a rule's label.
+        """
+        local, consumed = self.resolve(data, manifest)
+        remaining_manifest = [
+            field for field in manifest
+            if field.get("type") not in ("checkbox", "radio")
+            or not any(_on_form(mapping.label, [field]) for mapping in local)
+        ]
+        remaining_data = copy.deepcopy(data)
+        for path in consumed:
+            node = remaining_data
+            for key in path[:-1]:
+                node = node.get(key, {})
+            node.pop(path[-1], None)
+        return local, remaining_manifest, remaining_data
+
+    @staticmethod
+    def overrides(local: List[FieldMapping], mapping: FieldMapping) -> bool:
+        # Rule results win over anything the LLM produced for the same field.
+        return any(_same_label(mapping.label, rule.label) for rule in local)
+
+    def merge(self, local: List[FieldMapping], llm: List[FieldMapping]) -> List[FieldMapping]:
+        return local + [mapping for mapping in llm if not self.overrides(local, mapping)]
@@ -0,0 +1,96 @@
+import re
+from typing import Dict, List, Optional
+
+from form_manifest import extract_manifest
+
+# Heading keywords for each data section, checked in order (Part 6 headings mention neither party).
+SECTION_HINTS = [
+    ("part6", ("part 6", "additional information")),
+    ("client", ("client",)),
+    ("attorney", ("attorney", "representative", "eligibility")),
+]
+
+
+def normalize_label(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip().rstrip(":").strip().lower()
+
+
+def classify_section(heading: str) -> Optional[str]:
+    heading = (heading or "").lower()
+    for section, keywords in SECTION_HINTS:
+        if any(keyword in heading for keyword in keywords):
+            return section
+    return None
+
+
+class DomIndex:
+    """
+    Label -> control lookup table built from one manifest extraction per page load.
+
+    Exact matches on the normalized label are a dict lookup; anything else falls back to the
+    substring match Playwright's has_text used, and the answer is memoized. When a label repeats
+    across Parts, the control under a heading of the mapping's section wins.
+    """
+
+    def __init__(self, manifest: List[Dict]):
+        self.by_label: Dict[str, List[Dict]] = {}
+        self.by_id: Dict[str, Dict] = {}
+        for field in manifest:
+            entry = dict(field, data_section=classify_section(field["section"]))
+            self.by_label.setdefault(normalize_label(field["label"]), []).append(entry)
+            if field["id"]:
+                self.by_id[field["id"]] = entry
+        self._fuzzy: Dict[str, List[Dict]] = {}
+        self.lookups = 0
+        self.exact_hits = 0
+        self.fuzzy_hits = 0
+        self.unresolved: List[str] = []
+
+    @classmethod
+    async def build(cls, page) -> "DomIndex":
+        return cls((await extract_manifest(page))["fields"])
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "controls": len(self.by_id),
+            "lookups": self.lookups,
+            "exact": self.exact_hits,
+            "fuzzy": self.fuzzy_hits,
+            "unresolved": len(self.unresolved),
+        }
+
+    def lookup(self, label: str, section: Optional[str] = None) -> Optional[Dict]:
+        self.lookups += 1
+        key = normalize_label(label)
+        candidates = self.by_label.get(key)
+        if candidates:
+            self.exact_hits += 1
+        else:
+            if key not in self._fuzzy:
+                self._fuzzy[key] = [
+                    entry for text, entries in self.by_label.items() if key and key in text
+                    for entry in entries
+                ]
+            candidates = self._fuzzy[key]
+            if not candidates:
+                self.unresolved.append(label)
+                return None
+            self.fuzzy_hits += 1
+        if section:
+            for entry in candidates:
+                if entry["data_section"] == section:
+                    return entry
+        return candidates[0]
+
+    def get(self, control_id: str) -> Optional[Dict]:
+        return self.by_id.get(control_id.lstrip("#"))
+
+    def has(self, selector: str) -> bool:
+        return self.get(selector) is not None
+
+    @staticmethod
+    def selector_for(entry: Dict) -> str:
+        if entry["id"]:
+            return f'[id="{entry["id"]}"]'
+        return f'{entry["tag"]}[name="{entry["name"]}"]'
@@ -1,7 +1,15 @@
+import logging
+from typing import Optional
+
+from dom_index import DomIndex
+from instrumentation import tracer
 from llm_mapper import FieldMapping
 
+logger = logging.getLogger(__name__)
+
 
-async def fill_field_dynamic(page, mapping_item: FieldMapping):
+@tracer.traced("fill.field", lambda page, mapping_item, index=None: {"label": mapping_item.label})
+async def fill_field_dynamic(page, mapping_item: FieldMapping, index: Optional[DomIndex] = None):
     label_text = mapping_item.label
     value = mapping_item.value
 
@@ -15,7 +23,7 @@ async def fill_field_dynamic(page, mapping_item: FieldMapping):
                 await am_checkbox.click()
             if await not_checkbox.is_checked():
                 await not_checkbox.click()
-            print(f"✅ [Dynamic] Set '1.c. I (select only one box)' to 'am'")
+            logger.debug("✅ [Dynamic] Set '1.c. I (select only one box)' to 'am'")
         elif normalized == "am not":
             am_checkbox = page.locator("#am-subject")
             not_checkbox = page.locator("#not-subject")
@@ -23,11 +31,10 @@ async def fill_field_dynamic(page, mapping_item: FieldMapping):
                 await not_checkbox.click()
             if await am_checkbox.is_checked():
                 await am_checkbox.click()
-            print(f"✅ [Dynamic] Set '1.c. I (select only one box)' to 'am not'")
+            logger.debug("✅ [Dynamic] Set '1.c. I (select only one box)' to 'am not'")
         else:
-            print(
-                f"⚠️ [Dynamic] Unexpected value '{value}' for '1.c. I (select only one box)'; skipping."
-            )
+            logger.warning("⚠️ [Dynamic] Unexpected value '%s' for '1.c. I (select only one box)'; skipping.",
+                           value)
         return
 
     # Special handling for client_type mapping (appearance checkbox)
@@ -46,55 +53,66 @@ async def fill_field_dynamic(page, mapping_item: FieldMapping):
             if value.strip().lower() in label_val.lower():
                 if not await checkbox.is_checked():
                     await checkbox.click()
-                print(f"✅ [Dynamic] Set appearance checkbox to '{label_val}'")
+                logger.debug("✅ [Dynamic] Set appearance checkbox to '%s'", label_val)
                 matched = True
             else:
                 if await checkbox.is_checked():
                     await checkbox.uncheck()
         if not matched:
-            print(f"⚠️ [Dynamic] No appearance checkbox label matched client_type value '{value}'")
+            logger.warning("⚠️ [Dynamic] No appearance checkbox label matched client_type value '%s'",
+                           value)
         return
 
     if label_text.strip() == "2.d. Additional Information":
-        print(f"ℹ️ [Dynamic] Skipping dynamic fill for '{label_text}' (handled statically).")
+        logger.info("ℹ️ [Dynamic] Skipping dynamic fill for '%s' (handled statically).", label_text)
         return
 
     try:
-        label_locator = page.locator("label", has_text=label_text).first
-        if await label_locator.count() == 0:
-            print(f"⚠️ [Dynamic] Label '{label_text}' not found; skipping.")
-            return
-        input_id = await label_locator.get_attribute("for")
-        if input_id:
-            field_locator = page.locator(f"#{input_id}")
+        if index is not None:
+            # Resolved from the per-page index: no label scan or attribute queries needed.
+            entry = index.lookup(label_text, mapping_item.section)
+            if entry is None:
+                logger.warning("⚠️ [Dynamic] Label '%s' not found; skipping.", label_text)
+                return
+            field_locator = page.locator(index.selector_for(entry))
+            tag = entry["tag"]
+            input_type = entry["type"]
         else:
-            field_locator = label_locator.locator(
-                "xpath=following-sibling::*[self::input or self::textarea or self::select][1]")
-        if await field_locator.count() == 0:
-            print(f"⚠️ [Dynamic] Field for '{label_text}' not found; skipping.")
-            return
-        tag = await field_locator.evaluate("el => el.tagName.toLowerCase()")
+            label_locator = page.locator("label", has_text=label_text).first
+            if await label_locator.count() == 0:
+                logger.warning("⚠️ [Dynamic] Label '%s' not found; skipping.", label_text)
+                return
+            input_id = await label_locator.get_attribute("for")
+            if input_id:
+                field_locator = page.locator(f"#{input_id}")
+            else:
+                field_locator = label_locator.locator(
+                    "xpath=following-sibling::*[self::input or self::textarea or self::select][1]")
+            if await field_locator.count() == 0:
+                logger.warning("⚠️ [Dynamic] Field for '%s' not found; skipping.", label_text)
+                return
+            tag = await field_locator.evaluate("el => el.tagName.toLowerCase()")
+            input_type = await field_locator.get_attribute("type") if tag == "input" else None
         if tag == "input":
-            input_type = await field_locator.get_attribute("type")
             if input_type == "checkbox":
                 # Generic checkbox handling: if value is empty, uncheck.
                 if value.strip() == "":
                     await field_locator.uncheck()
-                    print(f"✅ [Dynamic] Left checkbox '{label_text}' unchecked (value empty).")
+                    logger.debug("✅ [Dynamic] Left checkbox '%s' unchecked (value empty).", label_text)
                 else:
                     desired = str(value).strip().lower() in ["yes", "true", "1", "on"]
                     current = await field_locator.is_checked()
                     if current != desired:
                         await field_locator.click()
-                    print(f"✅ [Dynamic] Set checkbox '{label_text}' to {desired}")
+                    logger.debug("✅ [Dynamic] Set checkbox '%s' to %s", label_text, desired)
             else:
                 await field_locator.fill(value)
-                print(f"✅ [Dynamic] Filled '{label_text}' with '{value}'")
+                logger.debug("✅ [Dynamic] Filled '%s' with '%s'", label_text, value)
         elif tag == "select":
             await field_locator.select_option(value=value)
-            print(f"✅ [Dynamic] Selected '{label_text}' with '{value}'")
+            logger.debug("✅ [Dynamic] Selected '%s' with '%s'", label_text, value)
         else:
             await field_locator.fill(value)
-            print(f"✅ [Dynamic] Filled '{label_text}' with '{value}'")
+            logger.debug("✅ [Dynamic] Filled '%s' with '%s'", label_text, value)
     except Exception as e:
-        print(f"⚠️ [Dynamic] Error processing mapping for '{label_text}': {e}")
+        logger.warning("⚠️ [Dynamic] Error processing mapping for '%s': %s", label_text, e)
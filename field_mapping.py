@@ -0,0 +1,35 @@
+class FieldMapping:
+    """
+    One form field and the value to put in it. A plain class rather than a pydantic model so
+    cached and rule-derived mappings do not pay for importing pydantic.
+    """
+
+    __slots__ = ("section", "label", "value")
+
+    def __init__(self, section: str, label: str, value, **_extra):
+        # Extra keys in a model's answer are ignored, as the pydantic model did.
+        if not isinstance(section, str) or not isinstance(label, str):
+            raise ValueError(f"section and label must be strings, got {section!r} and {label!r}")
+        self.section = section
+        self.label = label
+        self.value = self.ensure_string(value)
+
+    @staticmethod
+    def ensure_string(v) -> str:
+        if isinstance(v, bool):
+            return "yes" if v else "no"
+        return str(v)
+
+    def __eq__(self, other):
+        if not isinstance(other, FieldMapping):
+            return NotImplemented
+        return (self.section, self.label, self.value) == (other.section, other.label, other.value)
+
+    def __hash__(self):
+        return hash((self.section, self.label, self.value))
+
+    def __repr__(self):
+        return f"FieldMapping(section={self.section!r}, label={self.label!r}, value={self.value!r})"
+
+    def __str__(self):
+        return f"section={self.section!r} label={self.label!r} value={self.value!r}"
@@ -0,0 +1,170 @@
+from typing import Dict, List, Optional
+
+from dom_index import DomIndex
+from field_mapping import FieldMapping
+from instrumentation import tracer
+
+APPLIED = "applied"
+NOT_FOUND = "not_found"
+TYPE_MISMATCH = "type_mismatch"
+SKIPPED = "skipped"
+
+TRUTHY_VALUES = ["yes", "true", "1", "on"]
+
+# Operations settled in Python without touching the page.
+LOCAL_KINDS = ("reject", "missing", "skip")
+
+# Applies a whole fill plan in one page.evaluate() call and reports a status per operation.
+# Values are set through the native setters and followed by input/change events so the
+# form's own listeners run exactly as they would for user input.
+APPLY_PLAN_SCRIPT = """
+(plan) => {
+    const norm = (s) => (s || "").replace(/\\s+/g, " ").trim().toLowerCase();
+    const truthy = new Set(%s);
+    const fire = (el) => {
+        el.dispatchEvent(new Event("input", {bubbles: true}));
+        el.dispatchEvent(new Event("change", {bubbles: true}));
+    };
+    const setValue = (el, value) => {
+        const proto = Object.getPrototypeOf(el);
+        const setter = Object.getOwnPropertyDescriptor(proto, "value").set;
+        setter.call(el, value);
+        fire(el);
+    };
+    const setChecked = (el, checked) => {
+        if (el.checked !== checked) {
+            el.click();
+        }
+    };
+    const labels = Array.from(document.querySelectorAll("label"));
+    const resolve = (op) => {
+        if (op.selector) {
+            return document.querySelector(op.selector);
+        }
+        const wanted = norm(op.label);
+        const label = labels.find((l) => norm(l.textContent).includes(wanted));
+        if (!label) {
+            return null;
+        }
+        const forId = label.getAttribute("for");
+        if (forId) {
+            return document.getElementById(forId);
+        }
+        let next = label.nextElementSibling;
+        while (next && !["INPUT", "TEXTAREA", "SELECT"].includes(next.tagName)) {
+            next = next.nextElementSibling;
+        }
+        return next;
+    };
+    const labelFor = (el) => {
+        const label = el.id ? document.querySelector(`label[for="${CSS.escape(el.id)}"]`) : null;
+        return norm(label ? label.textContent : "");
+    };
+
+    return plan.map((op) => {
+        const result = {label: op.label, status: "applied", detail: ""};
+        if (op.kind === "choice") {
+            const boxes = Array.from(document.querySelectorAll(`input[name="${op.name}"]`));
+            if (!boxes.length) {
+                return {...result, status: "not_found"};
+            }
+            const wanted = norm(op.value);
+            let matched = null;
+            for (const box of boxes) {
+                const hit = wanted !== "" && labelFor(box).includes(wanted);
+                setChecked(box, hit);
+                if (hit) {
+                    matched = box.id;
+                }
+            }
+            return matched ? {...result, detail: matched}
+                           : {...result, status: "type_mismatch", detail: "no option matches"};
+        }
+        const el = resolve(op);
+        if (!el) {
+            return {...result, status: "not_found"};
+        }
+        result.detail = el.id || "";
+        const tag = el.tagName.toLowerCase();
+        const type = (el.getAttribute("type") || "").toLowerCase();
+        if (op.kind === "check" || (tag === "input" && (type === "checkbox" || type === "radio"))) {
+            if (tag !== "input" || (type !== "checkbox" && type !== "radio")) {
+                return {...result, status: "type_mismatch", detail: `${tag}[${type}] is not a checkbox`};
+            }
+            const checked = op.kind === "check" ? op.checked : truthy.has(norm(op.value));
+            setChecked(el, checked);
+            return result;
+        }
+        if (tag === "select") {
+            if (!Array.from(el.options).some((o) => o.value === op.value)) {
+                return {...result, status: "type_mismatch", detail: `'${op.value}' is not an option`};
+            }
+            setValue(el, op.value);
+            return result;
+        }
+        if (tag !== "input" && tag !== "textarea") {
+            return {...result, status: "type_mismatch", detail: `${tag} is not fillable`};
+        }
+        setValue(el, op.value);
+        return result;
+    });
+}
+""" % str(TRUTHY_VALUES)
+
+
+def compile_plan(mappings: List[FieldMapping], index: Optional[DomIndex] = None) -> List[Dict]:
+    plan = []
+    for mapping in mappings:
+        label_text = mapping.label
+        value = mapping.value
+        # Same special cases as fill_field_dynamic(), expressed as plain operations.
+        if "1.c. I (select only one box)" in label_text:
+            normalized = value.strip().lower()
+            if normalized not in ("am", "am not"):
+                plan.append({"kind": "reject", "label": label_text, "value": value})
+                continue
+            plan.append({"kind": "check", "label": label_text, "selector": "#am-subject",
+                         "checked": normalized == "am"})
+            plan.append({"kind": "check", "label": label_text, "selector": "#not-subject",
+                         "checked": normalized == "am not"})
+        elif "I enter my appearance as an attorney" in label_text:
+            plan.append({"kind": "choice", "label": label_text, "name": "client-type",
+                         "value": value.strip()})
+        elif label_text.strip() == "2.d. Additional Information":
+            plan.append({"kind": "skip", "label": label_text, "value": value})
+        elif index is not None:
+            # Resolve the control up front so the page script does not scan labels.
+            entry = index.lookup(label_text, mapping.section)
+            if entry is None:
+                plan.append({"kind": "missing", "label": label_text, "value": value})
+            else:
+                plan.append({"kind": "field", "label": label_text, "value": value,
+                             "selector": index.selector_for(entry)})
+        else:
+            plan.append({"kind": "field", "label": label_text, "value": value})
+    return plan
+
+
+@tracer.traced("fill.plan", lambda page, plan: {"ops": len(plan)})
+async def apply_plan(page, plan: List[Dict]) -> List[Dict]:
+    browser_ops = [op for op in plan if op["kind"] not in LOCAL_KINDS]
+    browser_results = iter(await page.evaluate(APPLY_PLAN_SCRIPT, browser_ops)) if browser_ops else iter([])
+    results = []
+    for op in plan:
+        if op["kind"] == "reject":
+            results.append({"label": op["label"], "status": TYPE_MISMATCH,
+                            "detail": f"unexpected value '{op['value']}'"})
+        elif op["kind"] == "missing":
+            results.append({"label": op["label"], "status": NOT_FOUND, "detail": "not in DOM index"})
+        elif op["kind"] == "skip":
+            results.append({"label": op["label"], "status": SKIPPED, "detail": "handled statically"})
+        else:
+            results.append(next(browser_results))
+    return results
+
+
+def summarize_results(results: List[Dict]) -> Dict[str, int]:
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    return counts
@@ -0,0 +1,67 @@
+from typing import Dict, List
+
+from dom_index import normalize_label
+
+
+def field_key(field: Dict) -> str:
+    # Identity of a control across form versions: its id, else its name and kind, else its label.
+    if field.get("id"):
+        return f"id:{field['id']}"
+    if field.get("name"):
+        return f"name:{field['tag']}:{field['type']}:{field['name']}:{normalize_label(field['label'])}"
+    return f"label:{field['tag']}:{field['type']}:{normalize_label(field['label'])}"
+
+
+def field_signature(field: Dict) -> tuple:
+    # Everything the LLM sees about a field; any difference means its mapping may be stale.
+    return (normalize_label(field["section"]), normalize_label(field["label"]), field["tag"], field["type"],
+            field.get("name", ""), normalize_label(field.get("group", "")), tuple(field.get("options", [])))
+
+
+def diff_manifests(previous: List[Dict], current: List[Dict]) -> Dict[str, List]:
+    before = {}
+    for field in previous:
+        before.setdefault(field_key(field), field)
+    diff = {"added": [], "changed": [], "removed": [], "unchanged": []}
+    seen = set()
+    for field in current:
+        key = field_key(field)
+        if key in seen:
+            continue
+        seen.add(key)
+        old = before.get(key)
+        if old is None:
+            diff["added"].append(field)
+        elif field_signature(old) != field_signature(field):
+            diff["changed"].append({"before": old, "after": field})
+        else:
+            diff["unchanged"].append(field)
+    diff["removed"] = [field for key, field in before.items() if key not in seen]
+    return diff
+
+
+def stale_labels(diff: Dict[str, List]) -> set:
+    """
+    Normalized labels (and checkbox group labels) whose previous mappings can no longer be
+    trusted: they belonged to a removed or changed field and no unchanged field still carries them.
+    """
+    stale = set()
+    for field in diff["removed"] + [change["before"] for change in diff["changed"]]:
+        stale.update(normalize_label(text) for text in (field["label"], field.get("group", "")) if text)
+    for field in diff["unchanged"]:
+        stale.discard(normalize_label(field["label"]))
+        stale.discard(normalize_label(field.get("group", "")))
+    return stale
+
+
+def drift_report(diff: Dict[str, List]) -> Dict:
+    return {
+        "added": [field["label"] for field in diff["added"]],
+        "changed": [{
+            "label": change["after"]["label"],
+            "was": change["before"]["label"],
+            "id": change["after"]["id"],
+        } for change in diff["changed"]],
+        "removed": [field["label"] for field in diff["removed"]],
+        "unchanged": len(diff["unchanged"]),
+    }
@@ -1,52 +1,305 @@
 import asyncio
-from playwright.async_api import async_playwright
-from llm_mapper import LLMMapper
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+from llm_mapper import FieldMapping, LLMMapper, MappingFailed
+from mapping_cache import MappingCache, form_fingerprint
 from field_filler import fill_field_dynamic
+from fill_plan import APPLIED, SKIPPED, apply_plan, compile_plan, summarize_results
+from form_manifest import extract_manifest
+from dom_index import DomIndex
+from navigation import Navigator
 from static_fallbacks import StaticFallbacks
-from data import mock_data_all_fields
+from verification import verify_and_retry
+from instrumentation import tracer
+
+logger = logging.getLogger(__name__)
 
 TARGET_URL = "https://mendrika-alma.github.io/form-submission/"
 
 
 class FormFiller:
 
-    def __init__(self, target_url: str, mock_data: dict):
+    def __init__(self, target_url: str, mock_data: dict, cache: MappingCache = None,
+                 batched: bool = True, streaming: bool = False, section_parallel: bool = False,
+                 mapper: Optional[LLMMapper] = None, navigator: Optional[Navigator] = None,
+                 verify_retries: Optional[int] = 2):
         self.target_url = target_url
         self.mock_data = mock_data
-        self.mapper = LLMMapper()
-        self.static = StaticFallbacks()
+        self.batched = batched
+        self.streaming = streaming
+        self.section_parallel = section_parallel
+        self.mapper = mapper if mapper is not None else LLMMapper()
+        # Nothing is blocked by default: fill_form() shows the page to a person.
+        self.navigator = navigator if navigator is not None else Navigator(block_resources=())
+        self.cache = cache if cache is not None else MappingCache()
+        self.static = StaticFallbacks(mock_data)
+        # Rounds of targeted re-fills after the read-back; None skips verification altogether.
+        self.verify_retries = verify_retries
+        self.drift_report: Optional[Dict] = None
+        # Set when the LLM part of the mapping failed and only a partial mapping was filled.
+        self.mapping_error: Optional[str] = None
 
     async def fill_form(self):
+        from playwright.async_api import async_playwright
+
         async with async_playwright() as p:
             browser = await p.chromium.launch(headless=False)
             context = await browser.new_context()
             page = await context.new_page()
-            print(f"🌐 Navigating to {self.target_url}")
-            await page.goto(self.target_url)
-            await page.wait_for_load_state("domcontentloaded")
-            await asyncio.sleep(2)
-            await page.wait_for_selector(".form-container", timeout=60000)
-
-            # Get the raw HTML.
-            raw_html = await page.content()
-
-            # LLM CALL: Get mapping from raw HTML and mock data.
-            llm_mappings = await self.mapper.get_mapping(raw_html, self.mock_data)
-            if llm_mappings:
-                print("\n📋 LLM Mappings:")
+            await self.fill_page(page)
+            logger.info("\nℹ️ Skipping signature fields as required by assignment.")
+            logger.info("\n✅ Done. Form filled (without signing) but not submitted.")
+            await asyncio.sleep(1000000)
+            await browser.close()
+
+    async def open(self, page, expected_manifest: Optional[List[Dict]] = None):
+        logger.info("🌐 Navigating to %s", self.target_url)
+        await self.navigator.open(page, self.target_url, expected_manifest)
+
+    def cached_mappings(self, manifest: List[Dict]) -> Optional[List[FieldMapping]]:
+        # Reuse a cached mapping when the form structure and data shape are unchanged.
+        form_fp = form_fingerprint(manifest)
+        llm_mappings = self.cache.get(form_fp, self.mock_data)
+        if llm_mappings is None:
+            tracer.count("cache.miss")
+            return None
+        tracer.count("cache.hit")
+        logger.info("⚡ Mapping cache hit for form %s (%s)", form_fp, self.cache.stats)
+        self.cache.remember_form(self.target_url, manifest)
+        return llm_mappings
+
+    async def remap_drift(self, manifest: List[Dict]) -> Optional[List[FieldMapping]]:
+        # If this URL was mapped under an earlier version of the form, only remap what changed.
+        previous = self.cache.last_form(self.target_url)
+        if previous is None or form_fingerprint(previous) == form_fingerprint(manifest):
+            return None
+        previous_mappings = self.cache.get(form_fingerprint(previous), self.mock_data, count=False)
+        if previous_mappings is None:
+            return None
+        tracer.count("drift.incremental")
+        llm_mappings = await self.mapper.get_incremental_mapping(manifest, self.mock_data, previous,
+                                                                 previous_mappings)
+        self.drift_report = self.mapper.last_drift_report
+        return llm_mappings
+
+    def store_mappings(self, manifest: List[Dict], llm_mappings: List[FieldMapping]):
+        if self.cache.put(form_fingerprint(manifest), self.mock_data, llm_mappings):
+            self.cache.remember_form(self.target_url, manifest)
+
+    async def map_fields(self, manifest: List[Dict]) -> List[FieldMapping]:
+        llm_mappings = self.cached_mappings(manifest)
+        if llm_mappings is not None:
+            return llm_mappings
+        try:
+            llm_mappings = await self.remap_drift(manifest)
+            if llm_mappings is None:
+                # LLM CALL: Get mapping from the field manifest and mock data.
+                if self.section_parallel:
+                    llm_mappings = await self.mapper.get_mapping_by_section(manifest, self.mock_data)
+                else:
+                    llm_mappings = await self.mapper.get_mapping(manifest, self.mock_data)
+        except MappingFailed as e:
+            return self.mapping_failed(e)
+        if llm_mappings:
+            self.store_mappings(manifest, llm_mappings)
+        return llm_mappings
+
+    def mapping_failed(self, error: MappingFailed) -> List[FieldMapping]:
+        # Fill what could be mapped, but never cache it: the next record would reuse the gap.
+        self.mapping_error = str(error)
+        logger.warning("⚠️ LLM mapping failed (%s); filling %s mappings without caching them.",
+                       error, len(error.partial))
+        return error.partial
+
+    async def produce_mappings(self, manifest: List[Dict], queue: asyncio.Queue):
+        # Streaming variant of map_fields(): mappings are queued as soon as they parse, then None.
+        try:
+            llm_mappings = self.cached_mappings(manifest)
+            if llm_mappings is None:
+                # A drift remap is small enough to deliver in one piece.
+                try:
+                    llm_mappings = await self.remap_drift(manifest)
+                except MappingFailed as e:
+                    llm_mappings = self.mapping_failed(e)
+                else:
+                    if llm_mappings:
+                        self.store_mappings(manifest, llm_mappings)
+            if llm_mappings is not None:
                 for mapping in llm_mappings:
-                    print(mapping)
-                    await fill_field_dynamic(page, mapping)
+                    queue.put_nowait(mapping)
+                return
+            llm_mappings = []
+            try:
+                async for mapping in self.mapper.stream_mapping(manifest, self.mock_data):
+                    llm_mappings.append(mapping)
+                    queue.put_nowait(mapping)
+            except MappingFailed as e:
+                # What was streamed is already queued; it is only kept out of the cache.
+                self.mapping_failed(e)
+                return
+            stats = self.mapper.last_stream_stats
+            if llm_mappings and not stats["truncated"] and not stats["malformed"]:
+                self.store_mappings(manifest, llm_mappings)
+        finally:
+            queue.put_nowait(None)
+
+    async def stream_fill(self, page, index: DomIndex, queue: asyncio.Queue,
+                          static_ops: List[Dict] = ()) -> Tuple[List[FieldMapping], List[Dict], List[Dict],
+                                                                Optional[float]]:
+        # Returns the mappings, the plan compiled from them (batch by batch, static operations
+        # last), the per-operation results and when the first field was filled.
+        llm_mappings, plan, results = [], [], []
+        first_filled_at = None
+        done = False
+        while not done:
+            # Take everything that has arrived so far and apply it together.
+            pending = [await queue.get()]
+            while not queue.empty():
+                pending.append(queue.get_nowait())
+            if pending[-1] is None:
+                done = True
+                pending.pop()
+            # The static operations ride along with the last batch so they still win over the LLM.
+            extra = list(static_ops) if done else []
+            if not pending and not extra:
+                continue
+            llm_mappings += pending
+            batch = compile_plan(pending, index) + extra
+            plan += batch
+            if self.batched:
+                results += await apply_plan(page, batch)
             else:
-                print("⚠️ No LLM mappings returned.")
+                for mapping in pending:
+                    await fill_field_dynamic(page, mapping, index)
+                if extra:
+                    await apply_plan(page, extra)
+            if pending and first_filled_at is None:
+                first_filled_at = time.perf_counter()
+        return llm_mappings, plan, results, first_filled_at
 
-            # Minimal static fallbacks.
-            await self.static.fill_signature_dates(page)
-            await self.static.apply_part6(page)
-            await self.static.fill_unit_info(page, "attorney")
-            await self.static.fill_unit_info(page, "client")
+    def start_mapping(self, manifest: List[Dict]) -> Tuple[asyncio.Task, Optional[asyncio.Queue]]:
+        if self.streaming:
+            queue = asyncio.Queue()
+            return asyncio.create_task(self.produce_mappings(manifest, queue)), queue
+        return asyncio.create_task(self.map_fields(manifest)), None
 
-            print("\nℹ️ Skipping signature fields as required by assignment.")
-            print("\n✅ Done. Form filled (without signing) but not submitted.")
-            await asyncio.sleep(1000000)
-            await browser.close()
+    async def apply_mappings(self, page, index: DomIndex, llm_mappings: List[FieldMapping],
+                             static_ops: List[Dict] = ()) -> Tuple[List[Dict], List[Dict]]:
+        # Returns the compiled plan, which verification reuses, and the per-operation results.
+        logger.info("\n📋 %s LLM mappings", len(llm_mappings))
+        for mapping in llm_mappings:
+            logger.debug("%s", mapping)
+        plan = compile_plan(llm_mappings, index) + list(static_ops)
+        if self.batched:
+            # One in-page call for the whole mapping list and the static fields instead of
+            # several per field. Static operations come last, so they win over the LLM.
+            results = await apply_plan(page, plan)
+            for result in results:
+                if result["status"] != APPLIED:
+                    logger.warning("⚠️ [Batch] %s for '%s' %s",
+                                   result['status'], result['label'], result['detail'])
+            logger.info("✅ [Batch] Fill results: %s", summarize_results(results))
+            return plan, results
+        for mapping in llm_mappings:
+            await fill_field_dynamic(page, mapping, index)
+        if static_ops:
+            await apply_plan(page, list(static_ops))
+        return plan, []
+
+    @tracer.traced("record")
+    async def fill_page(self, page, expected_manifest: Optional[List[Dict]] = None) -> Dict:
+        """
+        Fill one record on an already created page and return a report with per-phase timings
+        and the fields that were not filled. When the caller already knows the form manifest,
+        the mapping runs concurrently with navigation and is only redone if the live form differs.
+        """
+        timings = {}
+        started = time.perf_counter()
+        mapping_task = queue = None
+        if expected_manifest is not None:
+            mapping_task, queue = self.start_mapping(expected_manifest)
+
+        try:
+            phase = time.perf_counter()
+            with tracer.span("navigate"):
+                await self.open(page, expected_manifest)
+            timings["navigate"] = time.perf_counter() - phase
+
+            # Extract a compact manifest of the fillable controls instead of the raw HTML.
+            phase = time.perf_counter()
+            with tracer.span("manifest"):
+                extracted = await extract_manifest(page)
+                manifest = extracted["fields"]
+                index = DomIndex(manifest)
+            timings["manifest"] = time.perf_counter() - phase
+
+            if mapping_task is not None and form_fingerprint(manifest) != form_fingerprint(expected_manifest):
+                logger.warning("⚠️ Live form differs from the expected manifest; remapping.")
+                mapping_task.cancel()
+                mapping_task = None
+            if mapping_task is None:
+                mapping_task, queue = self.start_mapping(manifest)
+
+            # Fields filled straight from the record, applied together with the LLM mappings.
+            with tracer.span("static"):
+                static_ops = self.static.plan(index)
+
+            phase = time.perf_counter()
+            results = []
+            if queue is not None:
+                # Fill while the LLM is still generating; mapping and filling share one phase.
+                with tracer.span("map_and_fill"):
+                    llm_mappings, plan, results, first_filled_at = await self.stream_fill(
+                        page, index, queue, static_ops)
+                    await mapping_task
+                if first_filled_at is not None:
+                    timings["first_field"] = first_filled_at - started
+                timings["map_and_fill"] = time.perf_counter() - phase
+                if not llm_mappings:
+                    logger.warning("⚠️ No LLM mappings returned.")
+            else:
+                with tracer.span("map"):
+                    llm_mappings = await mapping_task
+                timings["map"] = time.perf_counter() - phase
+                if not llm_mappings:
+                    logger.warning("⚠️ No LLM mappings returned.")
+                phase = time.perf_counter()
+                with tracer.span("fill", mappings=len(llm_mappings or []), static=len(static_ops)):
+                    plan, results = await self.apply_mappings(page, index, llm_mappings or [], static_ops)
+                timings["fill"] = time.perf_counter() - phase
+        finally:
+            # A failed navigation, manifest extraction or fill must not leave the mapping running.
+            if mapping_task is not None and not mapping_task.done():
+                mapping_task.cancel()
+
+        verification = None
+        if self.verify_retries is not None:
+            phase = time.perf_counter()
+            # The plan compiled for the fill is reused, so labels are not looked up twice. Batched
+            # fills report one status per operation, static ones included; per-field fills report
+            # none, so every operation is read back.
+            statuses = results if results else None
+            verification = await verify_and_retry(page, plan, statuses, self.verify_retries)
+            timings["verify"] = time.perf_counter() - phase
+        timings["total"] = time.perf_counter() - started
+
+        logger.info("🔎 DOM index lookups: %s", index.stats)
+        if index.unresolved:
+            logger.warning("⚠️ Unresolved labels: %s", index.unresolved)
+        unfilled = [r["label"] for r in results if r["status"] not in (APPLIED, SKIPPED)]
+        unfilled += [label for label in index.unresolved if label not in unfilled]
+        if verification is not None:
+            unfilled += [f["label"] for f in verification["failed"] if f["label"] not in unfilled]
+        return {
+            "status": "partial" if self.mapping_error else "ok" if llm_mappings else "no_mapping",
+            "timings": timings,
+            "mapped": len(llm_mappings or []),
+            # Prompt size of the compact manifest next to what the raw page HTML would have cost.
+            "html_tokens": extracted["html_tokens"],
+            "manifest_tokens": extracted["manifest_tokens"],
+            "unfilled": unfilled,
+            "verification": verification,
+            "drift": self.drift_report,
+            "mapping_error": self.mapping_error,
+        }
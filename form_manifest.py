@@ -0,0 +1,104 @@
+import logging
+import math
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Walks the DOM once and returns every fillable control with the text the LLM needs to map it.
+MANIFEST_SCRIPT = """
+() => {
+    const text = (el) => (el ? el.textContent : "").replace(/\\s+/g, " ").trim();
+    const skipped = new Set(["hidden", "submit", "button", "reset", "image", "file"]);
+    const fields = [];
+    let section = "";
+    for (const el of document.querySelectorAll("h1, h2, h3, h4, legend, input, select, textarea")) {
+        const tag = el.tagName.toLowerCase();
+        if (!["input", "select", "textarea"].includes(tag)) {
+            section = text(el);
+            continue;
+        }
+        const type = tag === "input" ? (el.getAttribute("type") || "text").toLowerCase() : "";
+        if (skipped.has(type)) {
+            continue;
+        }
+        let label = el.id ? document.querySelector(`label[for="${CSS.escape(el.id)}"]`) : null;
+        if (!label) {
+            label = el.closest("label");
+        }
+        let labelText = text(label);
+        if (!label) {
+            // ARIA names come before any guess from the neighbouring markup.
+            const labelledBy = (el.getAttribute("aria-labelledby") || "").split(/\\s+/).filter(Boolean);
+            labelText = labelledBy.map((id) => text(document.getElementById(id))).join(" ").trim()
+                || (el.getAttribute("aria-label") || "").trim();
+        }
+        if (!label && !labelText) {
+            // A preceding label that names another control (for="...") is not this one's.
+            let prev = el.previousElementSibling;
+            while (prev && (prev.tagName.toLowerCase() !== "label"
+                            || (prev.getAttribute("for") && prev.getAttribute("for") !== el.id))) {
+                prev = prev.previousElementSibling;
+            }
+            label = prev;
+            labelText = text(label);
+        }
+        const field = {
+            section: section,
+            label: labelText,
+            id: el.id || "",
+            name: el.getAttribute("name") || "",
+            tag: tag,
+            type: type,
+        };
+        if (type === "checkbox" || type === "radio") {
+            const group = el.parentElement && el.parentElement.closest("fieldset, .form-group, div");
+            const groupLabel = group ? group.querySelector("legend, label:not([for])") : null;
+            if (groupLabel && groupLabel !== label) {
+                field.group = text(groupLabel);
+            }
+        }
+        if (tag === "select") {
+            field.options = Array.from(el.options).map((o) => o.value);
+        }
+        fields.push(field);
+    }
+    return {fields: fields, html_chars: document.documentElement.outerHTML.length};
+}
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough GPT-style estimate (~4 characters per token); good enough to compare prompt sizes.
+    return math.ceil(len(text) / 4)
+
+
+async def extract_manifest(page) -> Dict:
+    result = await page.evaluate(MANIFEST_SCRIPT)
+    manifest = result["fields"]
+    html_tokens = math.ceil(result["html_chars"] / 4)
+    manifest_tokens = estimate_tokens(manifest_to_prompt(manifest))
+    saved = 100 * (1 - manifest_tokens / html_tokens) if html_tokens else 0
+    logger.info("📉 Prompt form content: ~%s tokens of HTML -> ~%s tokens of manifest "
+                "(%s fields, %.0f%% smaller)", html_tokens, manifest_tokens, len(manifest), saved)
+    return {"fields": manifest, "html_tokens": html_tokens, "manifest_tokens": manifest_tokens}
+
+
+def manifest_to_prompt(manifest: List[Dict]) -> str:
+    lines = []
+    section = None
+    for field in manifest:
+        if field["section"] != section:
+            section = field["section"]
+            lines.append(f"## {section}")
+        control = field["tag"] + (f":{field['type']}" if field["type"] else "")
+        parts = [field["label"] or "(no label)", control]
+        if field["id"]:
+            parts.append(f"id={field['id']}")
+        if field["name"] and field["name"] != field["id"]:
+            parts.append(f"name={field['name']}")
+        if field.get("group"):
+            parts.append(f"group={field['group']}")
+        if field.get("options"):
+            parts.append("options=" + ",".join(field["options"]))
+        lines.append(" | ".join(parts))
+    return "\n".join(lines)
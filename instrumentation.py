@@ -0,0 +1,145 @@
+import asyncio
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+def configure_logging(level: str = "INFO"):
+    logging.basicConfig(level=getattr(logging, level.upper(), logging.INFO), format="%(message)s")
+
+
+class Tracer:
+    """
+    Collects timing spans, counters and LLM token usage for one process.
+
+    Disabled by default: span() then yields immediately and nothing is recorded, so the hooks can
+    stay in the hot paths. Spans nest through a context variable, which asyncio copies into each
+    task, so concurrent records get separate tracks in the Chrome trace.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events: List[Dict] = []
+        self.counters: Dict[str, int] = {}
+        self.tokens: Dict[str, Dict[str, int]] = {}
+        self._ids = itertools.count(1)
+        self._tracks: Dict[int, int] = {}
+        self._origin = time.perf_counter()
+
+    def enable(self):
+        self.enabled = True
+        self.reset()
+
+    def reset(self):
+        self.events = []
+        self.counters = {}
+        self.tokens = {}
+        self._tracks = {}
+        self._origin = time.perf_counter()
+
+    def _track(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = id(task) if task is not None else 0
+        return self._tracks.setdefault(key, len(self._tracks) + 1)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        if not self.enabled:
+            yield attrs
+            return
+        span_id = next(self._ids)
+        parent = _current_span.get()
+        token = _current_span.set(span_id)
+        started = time.perf_counter()
+        error = None
+        try:
+            yield attrs
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            event = {
+                "type": "span",
+                "name": name,
+                "id": span_id,
+                "parent": parent,
+                "track": self._track(),
+                "start": started - self._origin,
+                "duration": time.perf_counter() - started,
+                "attrs": attrs,
+            }
+            if error:
+                event["error"] = error
+            self.events.append(event)
+
+    def traced(self, name: str, attrs: Callable[..., Dict] = None):
+        # Decorator form of span() for coroutine functions; attrs() gets the call's arguments.
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return await func(*args, **kwargs)
+                with self.span(name, **(attrs(*args, **kwargs) if attrs else {})):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name: str, amount: int = 1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_tokens(self, model: str, prompt_tokens: int, completion_tokens: int):
+        if not self.enabled:
+            return
+        usage = self.tokens.setdefault(model, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        usage["calls"] += 1
+        usage["prompt_tokens"] += prompt_tokens or 0
+        usage["completion_tokens"] += completion_tokens or 0
+
+    def summary(self) -> Dict:
+        phases = {}
+        for event in self.events:
+            phase = phases.setdefault(event["name"], {"count": 0, "total_seconds": 0.0})
+            phase["count"] += 1
+            phase["total_seconds"] += event["duration"]
+        return {"phases": phases, "counters": dict(self.counters), "tokens": dict(self.tokens)}
+
+    def export(self, path: str):
+        # ".jsonl" writes one event per line; anything else writes a Chrome trace (chrome://tracing, Perfetto).
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fh:
+            if path.endswith(".jsonl"):
+                for event in self.events:
+                    fh.write(json.dumps(event, default=str) + "\n")
+                fh.write(json.dumps({"type": "summary", **self.summary()}) + "\n")
+            else:
+                json.dump(self.chrome_trace(), fh, default=str)
+
+    def chrome_trace(self) -> Dict:
+        trace_events = [{
+            "name": event["name"],
+            "ph": "X",
+            "ts": round(event["start"] * 1e6),
+            "dur": round(event["duration"] * 1e6),
+            "pid": os.getpid(),
+            "tid": event["track"],
+            "args": dict(event["attrs"], **({"error": event["error"]} if "error" in event else {})),
+        } for event in self.events]
+        return {"traceEvents": trace_events, "otherData": self.summary()}
+
+
+tracer = Tracer()
@@ -0,0 +1,298 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+from form_manifest import estimate_tokens
+from instrumentation import tracer
+
+logger = logging.getLogger(__name__)
+
+# Provider answers worth another attempt: throttling, timeouts and transient server errors.
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {"RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError",
+                    "TimeoutException", "ConnectError", "ReadError", "RemoteProtocolError"}
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def _status(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    return _status(error) in RETRYABLE_STATUS or type(error).__name__ in RETRYABLE_ERRORS
+
+
+class TokenBucket:
+    """
+    Refills `rate_per_minute` units per minute up to `capacity`. acquire() waits until enough
+    units are available; requests larger than the capacity wait for a full bucket. The balance
+    may go negative when settle() charges more than was reserved.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.available = self.capacity
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1):
+        amount = min(amount, self.capacity)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # The lock keeps callers in arrival order; the first waiter sleeps for everyone behind it.
+        async with self._lock:
+            self._refill()
+            if self.available < amount:
+                delay = (amount - self.available) / self.rate
+                self.waits += 1
+                self.wait_seconds += delay
+                await asyncio.sleep(delay)
+                self._refill()
+            self.available -= amount
+
+    def settle(self, reserved: float, actual: float):
+        self._refill()
+        self.available = min(self.capacity, self.available + reserved - actual)
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        self._refill()
+        return {"available": round(self.available, 1), "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 3)}
+
+
+class LLMClient:
+    """
+    Process-wide gateway to the chat model: one pooled HTTP client (keep-alive connections are
+    reused across calls and records), a concurrency cap, token buckets for requests and tokens
+    per minute, and retries with jittered exponential backoff inside a per-call deadline.
+    """
+
+    def __init__(self, requests_per_minute: float = 500, tokens_per_minute: float = 30000,
+                 max_concurrency: int = 8, max_retries: int = 4, base_delay: float = 0.5,
+                 max_delay: float = 20.0, attempt_timeout: float = 60.0, deadline: float = 180.0,
+                 completion_estimate: int = 1024, base_url: Optional[str] = None,
+                 max_connections: int = 20):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.completion_estimate = completion_estimate
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.counters = {"calls": 0, "retries": 0, "rate_limited": 0, "timeouts": 0, "failures": 0}
+        self.queued = 0
+        self.peak_queued = 0
+        self.in_flight = 0
+        self._loop = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._http = None
+        self._models: Dict[tuple, object] = {}
+
+    def _bind_loop(self):
+        # Semaphores, locks and pooled connections belong to one event loop; rebuild them when a
+        # new asyncio.run() reuses the client.
+        loop = asyncio.get_running_loop()
+        if loop is self._loop:
+            return
+        self._loop = loop
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.requests._lock = None
+        self.tokens._lock = None
+        self._http = None
+        self._models = {}
+
+    def http_client(self):
+        if self._http is None:
+            import httpx
+            self._http = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections, keepalive_expiry=120),
+                timeout=httpx.Timeout(self.attempt_timeout, connect=10.0))
+        return self._http
+
+    def chat_model(self, model_name: str, temperature: float = 0):
+        # One ChatOpenAI per model, all on the shared connection pool. Retries are done here,
+        # so the SDK's own are switched off.
+        self._bind_loop()
+        key = (model_name, temperature)
+        if key not in self._models:
+            # Provider dependencies and the API key are only needed once a model is actually called.
+            from dotenv import find_dotenv, load_dotenv
+            from langchain_openai import ChatOpenAI
+            load_dotenv(find_dotenv())
+            extra = {}
+            if self.base_url and not os.environ.get("OPENAI_API_KEY"):
+                # A local stub takes any key, but the client refuses to start without one.
+                extra["api_key"] = "local-stub"
+            self._models[key] = ChatOpenAI(model=model_name, temperature=temperature, max_retries=0,
+                                           timeout=self.attempt_timeout, base_url=self.base_url,
+                                           http_async_client=self.http_client(), **extra)
+        return self._models[key]
+
+    @property
+    def metrics(self) -> Dict:
+        return dict(self.counters, queued=self.queued, peak_queued=self.peak_queued, in_flight=self.in_flight,
+                    requests_bucket=self.requests.stats, tokens_bucket=self.tokens.stats)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Full jitter, but never sooner than the provider's Retry-After.
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = _retry_after(error)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def _estimate(self, messages) -> int:
+        return estimate_tokens("".join(str(m.content) for m in messages)) + self.completion_estimate
+
+    @asynccontextmanager
+    async def _slot(self, reserved: int):
+        self._bind_loop()
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        try:
+            await self.requests.acquire(1)
+            await self.tokens.acquire(reserved)
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def _retry_or_raise(self, error: Exception, attempt: int, started: float):
+        if not is_retryable(error) or attempt >= self.max_retries:
+            self.counters["failures"] += 1
+            raise error
+        if _status(error) == 429 or type(error).__name__ == "RateLimitError":
+            self.counters["rate_limited"] += 1
+        if isinstance(error, asyncio.TimeoutError):
+            self.counters["timeouts"] += 1
+        delay = self._backoff(attempt, error)
+        if time.monotonic() - started + delay >= self.deadline:
+            self.counters["failures"] += 1
+            raise DeadlineExceeded(f"LLM call gave up after {attempt + 1} attempts: {error!r}") from error
+        self.counters["retries"] += 1
+        tracer.count("llm.retry")
+        logger.warning("🔁 [LLM] Attempt %s failed (%s); retrying in %.2fs", attempt + 1, error, delay)
+        await asyncio.sleep(delay)
+
+    def _attempt_timeout(self, started: float) -> float:
+        remaining = self.deadline - (time.monotonic() - started)
+        if remaining <= 0:
+            raise DeadlineExceeded(f"LLM call exceeded its {self.deadline}s deadline")
+        return min(self.attempt_timeout, remaining)
+
+    async def ainvoke(self, model, messages, usage_of=None):
+        """
+        model.ainvoke(messages) under the limiters, with retries. usage_of(response) returns
+        {"prompt_tokens", "completion_tokens"} and corrects the token bucket after the call.
+        """
+        self.counters["calls"] += 1
+        started = time.monotonic()
+        reserved = self._estimate(messages)
+        attempt = 0
+        while True:
+            try:
+                async with self._slot(reserved):
+                    response = await asyncio.wait_for(model.ainvoke(messages), self._attempt_timeout(started))
+            except DeadlineExceeded:
+                self.counters["failures"] += 1
+                raise
+            except Exception as e:
+                # A failed attempt used its request slot but no tokens.
+                self.tokens.settle(reserved, 0)
+                await self._retry_or_raise(e, attempt, started)
+                attempt += 1
+                continue
+            if usage_of is not None:
+                usage = usage_of(response)
+                if usage["prompt_tokens"] or usage["completion_tokens"]:
+                    self.tokens.settle(reserved, usage["prompt_tokens"] + usage["completion_tokens"])
+            return response
+
+    async def astream(self, model, messages) -> AsyncIterator:
+        # Retries only happen before the first chunk; a stream that fails midway is not replayed.
+        self.counters["calls"] += 1
+        started = time.monotonic()
+        reserved = self._estimate(messages)
+        attempt = 0
+        while True:
+            delivered = False
+            try:
+                async with self._slot(reserved):
+                    stream = model.astream(messages).__aiter__()
+                    while True:
+                        timeout = self.attempt_timeout if delivered else self._attempt_timeout(started)
+                        try:
+                            chunk = await asyncio.wait_for(stream.__anext__(), timeout)
+                        except StopAsyncIteration:
+                            return
+                        delivered = True
+                        yield chunk
+            except DeadlineExceeded:
+                self.counters["failures"] += 1
+                raise
+            except Exception as e:
+                if delivered:
+                    self.counters["failures"] += 1
+                    raise
+                self.tokens.settle(reserved, 0)
+                await self._retry_or_raise(e, attempt, started)
+                attempt += 1
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+            self._models = {}
+
+
+_shared: Optional[LLMClient] = None
+
+
+def shared_client() -> LLMClient:
+    global _shared
+    if _shared is None:
+        _shared = LLMClient()
+    return _shared
+
+
+def configure_shared_client(**kwargs) -> LLMClient:
+    global _shared
+    _shared = LLMClient(**kwargs)
+    return _shared
@@ -1,77 +1,510 @@
-import os
+import asyncio
 import json
-from dotenv import load_dotenv, find_dotenv
+import logging
 import re
-from typing import List, Dict
-from pydantic import BaseModel, validator
-from langchain.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+import time
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+from form_manifest import estimate_tokens, manifest_to_prompt
+from dom_index import DomIndex, classify_section, normalize_label
+from field_mapping import FieldMapping
+from checkbox_rules import RuleEngine
+from form_drift import diff_manifests, drift_report, stale_labels
+from instrumentation import tracer
+from llm_client import LLMClient, shared_client
+from model_router import TierStats, check_mapping, validate_mappings
 
-_ = load_dotenv(find_dotenv())
-os.environ["OPENAI_API_KEY"]
+logger = logging.getLogger(__name__)
 
 
-class FieldMapping(BaseModel):
-    section: str
-    label: str
-    value: str
+# Checkbox rules for the LLM, used only when the local RuleEngine is switched off.
+CHECKBOX_RULES_PROMPT = (
+    "For checkboxes, please follow these rules exactly:\n\n"
+    "1. For the checkbox next to '1.a. I am an attorney eligible to practice law in, and a member in good standing of, "
+    "the bar of the highest courts of the following jurisdictions. If you need extra space to complete this section, use the space provided in Part 6. Additional Information.', "
+    "output the value from attorney_eligible (output 'yes' if true, or an empty string if false).\n\n"
+    "2. For the field labeled '1.c. I (select only one box)', if the JSON value for subject_to_restrictions is 'yes', output 'am'; "
+    "if it is 'no', output 'am not'.\n\n"
+    "3. For the checkbox next to '2.a. I am an authorized representative of the following qualified nonprofit religious, charitable, social service, or similar organization.', "
+    "output 'yes' if is_nonprofit_rep is true, or an empty string otherwise.\n\n"
+    "4. For the checkbox next to '3. I am associated with', output 'yes' if associated_with_student is 'yes', or an empty string otherwise.\n\n"
+    "5. For the checkbox next to '1.a. Administrative Case', output 'yes' if administrative_case is true, or an empty string otherwise.\n\n"
+    "6. For the checkbox next to '2.a. Civil Case', output 'yes' if civil_case is true, or an empty string otherwise.\n\n"
+    "7. For the checkbox next to '3.a. Other Legal Matter', output 'yes' if other_legal is true, or an empty string otherwise.\n\n"
+    "8. For the checkbox under '5. I enter my appearance as an attorney or accredited representative at the request of the (select only one box):', "
+    "output the value from client_type. For example, if client_type is 'Beneficiary', output Beneficiary; otherwise output an empty string.\n\n"
+    "9. For the checkbox next to '1.a. I request that all original notices on an application or petition be sent to the business address of my attorney or representative as listed in this form.', "
+    "output 'yes' if send_notices_to_attorney is 'Y', or an empty string otherwise.\n\n"
+    "10. For the checkbox next to '1.b. I request that any important documents that I receive be sent to the business address of my attorney or representative.', "
+    "output 'yes' if send_documents_to_attorney is 'Y', or an empty string otherwise.\n\n"
+    "11. For the checkbox next to '1.c. I request that important documentation be sent to me at my mailing address.', "
+    "output an empty string if send_documents_to_client is 'N', and 'yes' otherwise.\n\n"
+    "Example for rule 2: If subject_to_restrictions is 'yes', then for the field labeled '1.c. I (select only one box)', the output should be: 'section': 'attorney', 'label': '1.c. I (select only one box)', 'value': 'am'.\n\n"
+    "Example for rule 8: If client_type is 'Beneficiary', then for the corresponding field, output: 'section': 'client', 'label': '5. I enter my appearance as an attorney or accredited representative at the request of the (select only one box):', 'value': 'Beneficiary'."
+    "\n\n"
+)
 
-    @validator("value", pre=True)
-    def ensure_string(cls, v):
-        if isinstance(v, bool):
-            return "yes" if v else "no"
-        return str(v)
+
+class MappingFailed(Exception):
+    """
+    The LLM part of a mapping produced nothing usable. partial holds what can still be filled
+    (rule results and any valid answers); it must not be cached.
+    """
+
+    def __init__(self, message: str, partial: Optional[List[FieldMapping]] = None):
+        super().__init__(message)
+        self.partial = partial or []
+
+
+class JSONArrayStreamParser:
+    """
+    Incrementally parses a streamed JSON array of objects. feed() returns every object completed
+    by the new chunk; text outside the array (prose, code fences) is ignored.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self.malformed: List[str] = []
+        self._buffer = ""
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._object_start = None
+
+    def feed(self, chunk: str) -> List[Dict]:
+        objects = []
+        offset = len(self._buffer)
+        self._buffer += chunk
+        for i in range(offset, len(self._buffer)):
+            ch = self._buffer[i]
+            if self.finished:
+                break
+            if not self.started:
+                self.started = ch == "["
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._object_start = i
+                self._depth += 1
+            elif ch == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    text = self._buffer[self._object_start:i + 1]
+                    try:
+                        objects.append(json.loads(text))
+                    except ValueError:
+                        self.malformed.append(text)
+                    self._object_start = None
+            elif ch == "]" and self._depth == 0:
+                self.finished = True
+        if self._object_start is None:
+            # Nothing pending: drop consumed text so the buffer stays small.
+            self._buffer = ""
+        else:
+            self._buffer = self._buffer[self._object_start:]
+            self._object_start = 0
+        return objects
+
+    @property
+    def trailing(self) -> str:
+        # Text of an object that was still open when the stream ended.
+        return self._buffer if self._object_start is not None else ""
 
 
 class LLMMapper:
 
-    def __init__(self, model_name: str = "gpt-4o", temperature: int = 0):
+    SECTIONS = ("attorney", "client", "part6")
+
+    def __init__(self, model_name: str = "gpt-4o", temperature: int = 0, max_concurrency: int = 3,
+                 use_rules: bool = True, client: Optional[LLMClient] = None,
+                 fast_model: Optional[str] = None, require_all_fields: bool = True):
         self.model_name = model_name
+        # With a fast model, every call goes to it first and only fields whose answers fail
+        # validation against the manifest, or that it skipped although it was expected to map
+        # them (require_all_fields), are escalated to model_name.
+        self.fast_model = fast_model
+        self.require_all_fields = require_all_fields
+        self.tier_stats = TierStats()
         self.temperature = temperature
+        self.max_concurrency = max_concurrency
+        self.use_rules = use_rules
+        self.rules = RuleEngine()
+        # Shared by every mapper in the process unless one is passed in, so connections and rate
+        # limits are pooled across records.
+        self.client = client if client is not None else shared_client()
+        self.last_rule_stats: Optional[Dict] = None
+        self.last_stream_stats: Optional[Dict] = None
+        self.last_section_report: Optional[Dict] = None
+        self.last_drift_report: Optional[Dict] = None
+
+    def _build_messages(self, manifest: List[Dict], data: Dict, section: Optional[str] = None):
+        # Imported here so runs served from the cache or the rules never load LangChain.
+        from langchain.prompts import ChatPromptTemplate
 
-    async def get_mapping(self, html_content: str, data: Dict) -> List[FieldMapping]:
+        # With the rule engine on, the checkbox rules are already applied locally and left out.
+        rules = "" if self.use_rules else CHECKBOX_RULES_PROMPT
         prompt = ChatPromptTemplate.from_messages([("system", (
-            "You are an expert form-filling assistant. Analyze the provided HTML and JSON data. "
+            "You are an expert form-filling assistant. Analyze the provided form field list and JSON data. "
+            "Each form field line reads 'label | control | id | group | options', grouped under the heading of its part. "
             "For each fillable field in the form, produce an object with keys section, label, and value. "
             "The section must be one of attorney, client, or part6.\n\n"
-            "For checkboxes, please follow these rules exactly:\n\n"
-            "1. For the checkbox next to '1.a. I am an attorney eligible to practice law in, and a member in good standing of, "
-            "the bar of the highest courts of the following jurisdictions. If you need extra space to complete this section, use the space provided in Part 6. Additional Information.', "
-            "output the value from attorney_eligible (output 'yes' if true, or an empty string if false).\n\n"
-            "2. For the field labeled '1.c. I (select only one box)', if the JSON value for subject_to_restrictions is 'yes', output 'am'; "
-            "if it is 'no', output 'am not'.\n\n"
-            "3. For the checkbox next to '2.a. I am an authorized representative of the following qualified nonprofit religious, charitable, social service, or similar organization.', "
-            "output 'yes' if is_nonprofit_rep is true, or an empty string otherwise.\n\n"
-            "4. For the checkbox next to '3. I am associated with', output 'yes' if associated_with_student is 'yes', or an empty string otherwise.\n\n"
-            "5. For the checkbox next to '1.a. Administrative Case', output 'yes' if administrative_case is true, or an empty string otherwise.\n\n"
-            "6. For the checkbox next to '2.a. Civil Case', output 'yes' if civil_case is true, or an empty string otherwise.\n\n"
-            "7. For the checkbox next to '3.a. Other Legal Matter', output 'yes' if other_legal is true, or an empty string otherwise.\n\n"
-            "8. For the checkbox under '5. I enter my appearance as an attorney or accredited representative at the request of the (select only one box):', "
-            "output the value from client_type. For example, if client_type is 'Beneficiary', output Beneficiary; otherwise output an empty string.\n\n"
-            "9. For the checkbox next to '1.a. I request that all original notices on an application or petition be sent to the business address of my attorney or representative as listed in this form.', "
-            "output 'yes' if send_notices_to_attorney is 'Y', or an empty string otherwise.\n\n"
-            "10. For the checkbox next to '1.b. I request that any important documents that I receive be sent to the business address of my attorney or representative.', "
-            "output 'yes' if send_documents_to_attorney is 'Y', or an empty string otherwise.\n\n"
-            "11. For the checkbox next to '1.c. I request that important documentation be sent to me at my mailing address.', "
-            "output an empty string if send_documents_to_client is 'N', and 'yes' otherwise.\n\n"
+            "{rules}"
+            "For checkboxes, output 'yes' to check the box or an empty string to leave it unchecked. "
             "For text fields, simply output the corresponding value from the JSON data. "
-            "Return only a valid JSON array of these objects with no additional commentary.\n\n"
-            "Example for rule 2: If subject_to_restrictions is 'yes', then for the field labeled '1.c. I (select only one box)', the output should be: 'section': 'attorney', 'label': '1.c. I (select only one box)', 'value': 'am'.\n\n"
-            "Example for rule 8: If client_type is 'Beneficiary', then for the corresponding field, output: 'section': 'client', 'label': '5. I enter my appearance as an attorney or accredited representative at the request of the (select only one box):', 'value': 'Beneficiary'."
-        )), ("user", "HTML:\n{html}\n\nDATA:\n{data}\n\nReturn only the JSON array.")])
-        messages = prompt.format_messages(html=html_content, data=json.dumps(data, indent=2))
-        model = ChatOpenAI(model=self.model_name, temperature=self.temperature)
-        response = await model.ainvoke(messages)
-        cleaned = re.search(r"\[.*\]", response.content, re.DOTALL)
+            "Return only a valid JSON array of these objects with no additional commentary."
+        )), ("user", "{scope}FORM FIELDS:\n{fields}\n\nDATA:\n{data}\n\nReturn only the JSON array.")])
+        scope = f"Only map the fields of the {section} section; use section '{section}'.\n\n" if section else ""
+        return prompt.format_messages(rules=rules, scope=scope, fields=manifest_to_prompt(manifest),
+                                      data=json.dumps(data, indent=2))
+
+    @staticmethod
+    def _parse_response(content: str) -> Optional[List[FieldMapping]]:
+        # None when the output is not a JSON array of mappings, so callers can tell a failed
+        # answer from an empty one.
+        cleaned = re.search(r"\[.*\]", content, re.DOTALL)
         if cleaned:
             try:
                 mapping_list = json.loads(cleaned.group(0))
                 return [FieldMapping(**item) for item in mapping_list]
             except Exception as e:
-                print("❌ LLM parsing failed:", e)
-                print("Raw output:\n", response.content)
-                return []
+                logger.error("❌ LLM parsing failed: %s", e)
+                logger.error("Raw output:\n %s", content)
+                return None
+        else:
+            logger.error("❌ Could not find JSON array in LLM output.")
+            logger.error("Raw output:\n %s", content)
+            return None
+
+    @staticmethod
+    def _token_usage(response) -> Dict[str, int]:
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            return {"prompt_tokens": usage.get("input_tokens", 0),
+                    "completion_tokens": usage.get("output_tokens", 0)}
+        usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+        return {"prompt_tokens": usage.get("prompt_tokens", 0),
+                "completion_tokens": usage.get("completion_tokens", 0)}
+
+    def _apply_rules(self, manifest: List[Dict], data: Dict):
+        if not self.use_rules:
+            return [], manifest, data
+        return self.rules.split(manifest, data)
+
+    def _merge_rules(self, local: List[FieldMapping], llm: List[FieldMapping]) -> List[FieldMapping]:
+        merged = self.rules.merge(local, llm)
+        self.last_rule_stats = {"local": len(local), "llm": len(merged) - len(local)}
+        if self.use_rules:
+            logger.info("🧮 [Rules] %s fields resolved locally, %s by the LLM",
+                        len(local), len(merged) - len(local))
+        return merged
+
+    def _chat_model(self, model_name: Optional[str] = None):
+        # Anything with LangChain's ainvoke()/astream() works here; benchmarks swap in a replay model.
+        return self.client.chat_model(model_name or self.model_name, self.temperature)
+
+    async def _invoke(self, messages, model_name: Optional[str] = None, **span_attrs):
+        model_name = model_name or self.model_name
+        model = self._chat_model(model_name)
+        with tracer.span("llm.call", model=model_name, **span_attrs) as attrs:
+            response = await self.client.ainvoke(model, messages, self._token_usage)
+            usage = self._token_usage(response)
+            attrs.update(usage)
+        tracer.record_tokens(model_name, usage["prompt_tokens"], usage["completion_tokens"])
+        return response, usage
+
+    async def _escalate(self, fields: List[Dict], data: Dict,
+                        section: Optional[str] = None,
+                        partial: List[FieldMapping] = ()) -> Tuple[List[FieldMapping], Dict[str, int]]:
+        tracer.count("llm.escalated", len(fields))
+        started = time.perf_counter()
+        response, usage = await self._invoke(self._build_messages(fields, data, section),
+                                             scope=section or "form", tier="strong")
+        mappings = self._parse_response(response.content)
+        if mappings is None:
+            raise MappingFailed(f"{self.model_name} returned no usable mappings for {len(fields)} escalated fields",
+                                list(partial))
+        # The strong model has the last word; validation here only feeds the tier statistics.
+        checked = validate_mappings(mappings, fields, require_all=False)
+        self.tier_stats.record("strong", self.model_name, len(fields), len(mappings), len(checked["valid"]),
+                               time.perf_counter() - started, usage)
+        return mappings, usage
+
+    async def _route(self, manifest: List[Dict], data: Dict,
+                     section: Optional[str] = None) -> Tuple[List[FieldMapping], Dict[str, int]]:
+        started = time.perf_counter()
+        response, usage = await self._invoke(self._build_messages(manifest, data, section),
+                                             model_name=self.fast_model, scope=section or "form", tier="fast")
+        mappings = self._parse_response(response.content) or []
+        checked = validate_mappings(mappings, manifest, self.require_all_fields)
+        self.tier_stats.record("fast", self.fast_model, len(manifest), len(mappings), len(checked["valid"]),
+                               time.perf_counter() - started, usage)
+        for problem in checked["problems"]:
+            logger.info("🪜 [Router] Rejected '%s' = %r: %s", problem["label"], problem["value"], problem["problem"])
+        if not checked["valid"]:
+            # Nothing usable (prose, an empty array, all invalid): the strong tier maps everything.
+            logger.warning("⚠️ [Router] %s returned no usable mappings; escalating the whole %s.",
+                           self.fast_model, section or "form")
+            checked["retry_fields"] = manifest
+        usage = dict(usage)
+        mappings = checked["valid"]
+        if checked["retry_fields"]:
+            strong, strong_usage = await self._escalate(checked["retry_fields"], data, section, mappings)
+            mappings += strong
+            for key in usage:
+                usage[key] += strong_usage.get(key, 0)
+        logger.info("🪜 [Router] %s: %s kept %s mappings (%s rejected, %s fields skipped); %s fields escalated to %s",
+                    section or "form", self.fast_model, len(checked["valid"]), len(checked["problems"]),
+                    checked["missing"], len(checked["retry_fields"]), self.model_name)
+        return mappings, usage
+
+    async def _map(self, manifest: List[Dict], data: Dict,
+                   section: Optional[str] = None) -> Tuple[List[FieldMapping], Dict[str, int]]:
+        if not manifest:
+            # The rules resolved every field; there is nothing left to ask the model.
+            return [], {"prompt_tokens": 0, "completion_tokens": 0}
+        if self.fast_model:
+            mappings, usage = await self._route(manifest, data, section)
         else:
-            print("❌ Could not find JSON array in LLM output.")
-            print("Raw output:\n", response.content)
-            return []
+            response, usage = await self._invoke(self._build_messages(manifest, data, section),
+                                                 scope=section or "form")
+            mappings = self._parse_response(response.content)
+        if not mappings:
+            raise MappingFailed(f"{self.model_name} returned no usable mappings for {section or 'the form'}")
+        return mappings, usage
+
+    async def get_mapping(self, manifest: List[Dict], data: Dict) -> List[FieldMapping]:
+        local, manifest, data = self._apply_rules(manifest, data)
+        if not manifest:
+            logger.info("🧮 [Rules] Every field resolved locally; skipping the LLM call.")
+            return self._merge_rules(local, [])
+        started = time.perf_counter()
+        try:
+            mappings, usage = await self._map(manifest, data)
+        except MappingFailed as e:
+            raise MappingFailed(str(e), self._merge_rules(local, e.partial)) from e
+        logger.info("⏱️ [LLM] Full-form call: %.2fs, %s prompt / %s completion tokens",
+                    time.perf_counter() - started, usage['prompt_tokens'], usage['completion_tokens'])
+        return self._merge_rules(local, mappings)
+
+    async def get_incremental_mapping(self, manifest: List[Dict], data: Dict, previous_manifest: List[Dict],
+                                      previous_mappings: List[FieldMapping],
+                                      max_drift: float = 0.5) -> List[FieldMapping]:
+        """
+        Remap only what changed since previous_manifest: mappings of unchanged fields are reused,
+        those of removed or changed fields are dropped, and added or changed fields go to the LLM.
+        When more than max_drift of the form changed, the whole form is remapped instead. What
+        changed ends up in last_drift_report.
+        """
+        diff = diff_manifests(previous_manifest, manifest)
+        report = drift_report(diff)
+        delta = diff["added"] + [change["after"] for change in diff["changed"]]
+        if manifest and len(delta) > max_drift * len(manifest):
+            logger.warning("⚠️ [Drift] %s of %s fields changed; remapping the whole form.",
+                           len(delta), len(manifest))
+            mappings = await self.get_mapping(manifest, data)
+            report.update(mode="full", reused=0, dropped=len(previous_mappings), remapped_fields=len(manifest))
+            self.last_drift_report = report
+            return mappings
+
+        stale = stale_labels(diff)
+        kept = [mapping for mapping in previous_mappings if normalize_label(mapping.label) not in stale]
+        try:
+            remapped = await self.get_mapping(delta, data) if delta else []
+        except MappingFailed as e:
+            raise MappingFailed(str(e), self.rules.merge(e.partial, kept)) from e
+        merged = self.rules.merge(remapped, kept)
+        report.update(mode="incremental", reused=len(merged) - len(remapped),
+                      dropped=len(previous_mappings) - len(kept), remapped_fields=len(delta))
+        self.last_drift_report = report
+        logger.info("🧭 [Drift] %s added, %s changed, %s removed; reused %s mappings, sent %s fields to the LLM",
+                    len(report["added"]), len(report["changed"]), len(report["removed"]),
+                    report["reused"], len(delta))
+        return merged
+
+    def split_by_section(self, manifest: List[Dict], data: Dict) -> Dict[str, Dict]:
+        # Fields inherit the section of the last classified heading; leading unclassified
+        # fields and top-level data keys that belong to no section go to every call.
+        fields = {section: [] for section in self.SECTIONS}
+        shared_fields = []
+        current = None
+        for field in manifest:
+            current = classify_section(field["section"]) or current
+            (fields[current] if current else shared_fields).append(field)
+        shared_data = {key: value for key, value in data.items() if key not in self.SECTIONS}
+        return {
+            section: {
+                "manifest": shared_fields + fields[section],
+                "data": dict(shared_data, **({section: data[section]} if section in data else {})),
+            }
+            for section in self.SECTIONS if fields[section] or section in data
+        }
+
+    async def _map_section(self, semaphore: asyncio.Semaphore, section: str, part: Dict) -> Dict:
+        async with semaphore:
+            started = time.perf_counter()
+            call = {"section": section, "fields": len(part["manifest"])}
+            try:
+                mappings, usage = await self._map(part["manifest"], part["data"], section)
+            except Exception as e:
+                logger.error("❌ LLM call for section '%s' failed: %s", section, e)
+                # Valid answers a routed call kept before failing are still worth filling.
+                call.update(latency=time.perf_counter() - started, error=str(e),
+                            mappings=e.partial if isinstance(e, MappingFailed) else [])
+                return call
+            call["latency"] = time.perf_counter() - started
+            call.update(usage)
+            call["mappings"] = mappings
+            return call
+
+    async def get_mapping_by_section(self, manifest: List[Dict], data: Dict) -> List[FieldMapping]:
+        """
+        Map each section with its own, smaller LLM call (at most max_concurrency at a time), then
+        merge. Per-call latency/tokens, conflicts and missing sections end up in last_section_report.
+        """
+        local, manifest, data = self._apply_rules(manifest, data)
+        parts = self.split_by_section(manifest, data)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        started = time.perf_counter()
+        calls = await asyncio.gather(
+            *(self._map_section(semaphore, section, part) for section, part in parts.items()))
+        wall = time.perf_counter() - started
+
+        merged: Dict[tuple, FieldMapping] = {}
+        origin: Dict[tuple, str] = {}
+        conflicts = []
+        for call in calls:
+            for mapping in call["mappings"]:
+                key = (mapping.section, normalize_label(mapping.label))
+                if key not in merged:
+                    merged[key] = mapping
+                    origin[key] = call["section"]
+                elif merged[key].value != mapping.value:
+                    conflicts.append({
+                        "section": mapping.section,
+                        "label": mapping.label,
+                        "kept": merged[key].value,
+                        "kept_from": origin[key],
+                        "dropped": mapping.value,
+                        "dropped_from": call["section"],
+                    })
+        missing = [call["section"] for call in calls if call["fields"] and not call["mappings"]]
+        report = {
+            "wall_seconds": wall,
+            "sum_call_seconds": sum(call["latency"] for call in calls),
+            "prompt_tokens": sum(call.get("prompt_tokens", 0) for call in calls),
+            "completion_tokens": sum(call.get("completion_tokens", 0) for call in calls),
+            "calls": [{key: value for key, value in call.items() if key != "mappings"}
+                      | {"mappings": len(call["mappings"])} for call in calls],
+            "duplicates": sum(len(call["mappings"]) for call in calls) - len(merged) - len(conflicts),
+            "conflicts": conflicts,
+            "missing_sections": missing,
+        }
+        self.last_section_report = report
+        for call in report["calls"]:
+            logger.info("⏱️ [LLM] %s: %.2fs, %s prompt / %s completion tokens, %s mappings",
+                        call['section'], call['latency'], call.get('prompt_tokens', 0),
+                        call.get('completion_tokens', 0), call['mappings'])
+        logger.info("⏱️ [LLM] %s section calls in %.2fs wall (%.2fs if run one after another)",
+                    len(calls), wall, report['sum_call_seconds'])
+        for conflict in conflicts:
+            logger.warning("⚠️ [LLM] Conflicting values for '%s': kept '%s' (%s), dropped '%s' (%s)",
+                           conflict['label'], conflict['kept'], conflict['kept_from'],
+                           conflict['dropped'], conflict['dropped_from'])
+        if missing:
+            logger.warning("⚠️ [LLM] No mappings returned for sections: %s", missing)
+        mappings = self._merge_rules(local, list(merged.values()))
+        failed = [call["section"] for call in calls if "error" in call]
+        if failed or missing:
+            # A merge with a hole in it can be filled, but must not be cached for later records.
+            raise MappingFailed(f"sections failed: {sorted(set(failed + missing))}", mappings)
+        return mappings
+
+    async def stream_mapping(self, manifest: List[Dict], data: Dict) -> AsyncIterator[FieldMapping]:
+        local, manifest, data = self._apply_rules(manifest, data)
+        # Rule results need no model output, so they are the first fields to be filled.
+        for mapping in local:
+            yield mapping
+        if not manifest:
+            logger.info("🧮 [Rules] Every field resolved locally; skipping the LLM call.")
+            self.last_rule_stats = {"local": len(local), "llm": 0}
+            self.last_stream_stats = {"mappings": len(local), "malformed": 0, "truncated": False,
+                                      "first_mapping_seconds": None, "total_seconds": 0.0}
+            return
+        messages = self._build_messages(manifest, data)
+        model_name = self.fast_model or self.model_name
+        model = self._chat_model(model_name)
+        # A routed stream holds back answers that fail validation and escalates them at the end.
+        index = DomIndex(manifest) if self.fast_model else None
+        streamed = []
+        parser = JSONArrayStreamParser()
+        started = time.perf_counter()
+        first_at = None
+        count = 0
+        completion = []
+        usage = None
+        with tracer.span("llm.stream", model=model_name) as attrs:
+            async for chunk in self.client.astream(model, messages):
+                completion.append(chunk.content or "")
+                for item in parser.feed(chunk.content or ""):
+                    try:
+                        mapping = FieldMapping(**item)
+                    except Exception as e:
+                        parser.malformed.append(json.dumps(item))
+                        logger.error("❌ LLM mapping object rejected: %s", e)
+                        continue
+                    if self.rules.overrides(local, mapping):
+                        continue
+                    streamed.append(mapping)
+                    if index is not None and check_mapping(mapping, manifest, index)[0] is not None:
+                        continue
+                    if first_at is None:
+                        first_at = time.perf_counter() - started
+                    count += 1
+                    yield mapping
+            if tracer.enabled or self.fast_model:
+                # Streamed chunks carry no usage block, so token counts are estimated.
+                usage = {"prompt_tokens": estimate_tokens("".join(str(m.content) for m in messages)),
+                         "completion_tokens": estimate_tokens("".join(completion))}
+                attrs.update(usage, mappings=count)
+                tracer.record_tokens(model_name, usage["prompt_tokens"], usage["completion_tokens"])
+        if self.fast_model:
+            checked = validate_mappings(streamed, manifest, self.require_all_fields)
+            self.tier_stats.record("fast", self.fast_model, len(manifest), len(streamed), len(checked["valid"]),
+                                   time.perf_counter() - started, usage)
+            if not checked["valid"]:
+                logger.warning("⚠️ [Router] %s streamed no usable mappings; escalating the whole form.",
+                               self.fast_model)
+                checked["retry_fields"] = manifest
+            if checked["retry_fields"]:
+                strong, _ = await self._escalate(checked["retry_fields"], data)
+                for mapping in strong:
+                    if not self.rules.overrides(local, mapping):
+                        count += 1
+                        yield mapping
+        if not parser.started:
+            logger.error("❌ Could not find JSON array in streamed LLM output.")
+        elif parser.trailing or not parser.finished:
+            logger.warning("⚠️ LLM stream ended inside the JSON array; kept %s mappings, "
+                           "dropped partial output: %r", count, parser.trailing[:200])
+        for text in parser.malformed:
+            logger.warning("⚠️ Malformed mapping object skipped: %s", text[:200])
+        self.last_rule_stats = {"local": len(local), "llm": count}
+        self.last_stream_stats = {
+            "mappings": count + len(local),
+            "malformed": len(parser.malformed),
+            "truncated": bool(parser.trailing) or (parser.started and not parser.finished),
+            "first_mapping_seconds": first_at,
+            "total_seconds": time.perf_counter() - started,
+        }
+        if not count:
+            # Only the rule results went out; the caller must not cache them as a mapping.
+            raise MappingFailed(f"{model_name} streamed no usable mappings", local)
@@ -0,0 +1,174 @@
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+from form_manifest import estimate_tokens
+
+SECTIONS = ("attorney", "client", "part6")
+
+
+def pick_response(responses: Dict[str, List[Dict]], prompt: str) -> str:
+    # Per-section prompts get that section's recording, anything else the full-form one.
+    for section in SECTIONS:
+        if f"fields of the {section} section" in prompt:
+            return json.dumps(responses[section])
+    return json.dumps(responses["form"])
+
+
+class StubState:
+    """Settings and counters shared by all handler threads of one stub server."""
+
+    def __init__(self, responses: Dict[str, List[Dict]], requests_per_minute: int = 60,
+                 latency: float = 0.5, error_rate: float = 0.0, chunk_chars: int = 40):
+        self.responses = responses
+        self.requests_per_minute = requests_per_minute
+        self.latency = latency
+        self.error_rate = error_rate
+        self.chunk_chars = chunk_chars
+        self.counters = {"requests": 0, "served": 0, "rate_limited": 0, "errors": 0, "connections": 0}
+        self._window = deque()
+        self._lock = threading.Lock()
+
+    def admit(self) -> float:
+        # Sliding one-minute window; returns 0 when admitted, else seconds until a slot frees up.
+        with self._lock:
+            now = time.monotonic()
+            self.counters["requests"] += 1
+            while self._window and now - self._window[0] >= 60:
+                self._window.popleft()
+            if len(self._window) >= self.requests_per_minute:
+                self.counters["rate_limited"] += 1
+                return 60 - (now - self._window[0])
+            self._window.append(now)
+            return 0.0
+
+    def count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible /v1/chat/completions endpoint, streaming and non-streaming."""
+
+    protocol_version = "HTTP/1.1"
+    state: StubState = None
+
+    def setup(self):
+        super().setup()
+        self.state.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict, headers: Dict[str, str] = None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"no route {self.path}", "type": "invalid_request_error"}})
+            return
+        wait = self.state.admit()
+        if wait:
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                            {"Retry-After": f"{wait:.2f}"})
+            return
+        if random.random() < self.state.error_rate:
+            self.state.count("errors")
+            self._send_json(503, {"error": {"message": "Service unavailable", "type": "server_error"}})
+            return
+        messages = body.get("messages", [])
+        content = pick_response(self.state.responses, str(messages[-1].get("content", "")) if messages else "")
+        model = body.get("model", "stub")
+        time.sleep(self.state.latency)
+        self.state.count("served")
+        if body.get("stream"):
+            self._stream(model, content)
+            return
+        prompt_tokens = estimate_tokens("".join(str(m.get("content", "")) for m in messages))
+        completion_tokens = estimate_tokens(content)
+        self._send_json(200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def _stream(self, model: str, content: str):
+        # Server-sent events without a length, so this connection closes after the stream.
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        size = self.state.chunk_chars
+        pieces = [content[i:i + size] for i in range(0, len(content), size)]
+        for i, piece in enumerate(pieces + [""]):
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece} if piece else {},
+                             "finish_reason": None if i < len(pieces) else "stop"}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+@contextmanager
+def serve_stub(state: StubState, port: int = 0):
+    """Run the stub on 127.0.0.1 in a background thread and yield its OpenAI base URL."""
+    handler = type("BoundStubHandler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/v1"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub that replays recorded mappings.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--responses", default="bench_fixtures/llm_responses.json")
+    parser.add_argument("--rpm", type=int, default=60, help="requests per minute before answering 429")
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before each answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+    with open(args.responses, "r", encoding="utf-8") as fh:
+        responses = json.load(fh)
+    state = StubState(responses, args.rpm, args.latency, args.error_rate)
+    with serve_stub(state, args.port) as base_url:
+        print(f"🧪 Stub LLM listening on {base_url} (rpm={args.rpm}, latency={args.latency}s)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    print(f"📊 {state.counters}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from checkbox_rules import CHECKBOX_RULES
+from llm_mapper import FieldMapping
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = ".mapping_cache.json"
+CACHE_VERSION = 3
+
+# Values too generic to identify a single data field; mappings carrying them are stored as literals.
+_FLAG_VALUES = {"", "yes", "no", "y", "n", "true", "false", "on", "off", "1", "0"}
+
+# Template layouts remembered per form and data shape; the oldest is forgotten first.
+_MAX_LAYOUTS = 8
+
+
+def _digest(obj) -> str:
+    return hashlib.sha256(json.dumps(obj, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+
+
+def form_fingerprint(manifest: List[Dict]) -> str:
+    # Only structure counts: labels, control ids/names/types and select options.
+    return _digest([[
+        field["section"], field["label"], field["id"], field["name"], field["tag"], field["type"],
+        field.get("group", ""), field.get("options", [])
+    ] for field in manifest])
+
+
+def flatten_data(data, prefix: str = "") -> Dict[str, object]:
+    leaves = {}
+    if isinstance(data, dict):
+        items = data.items()
+    elif isinstance(data, list):
+        items = enumerate(data)
+    else:
+        return {prefix: data}
+    for key, value in items:
+        path = f"{prefix}.{key}" if prefix else str(key)
+        leaves.update(flatten_data(value, path))
+    return leaves
+
+
+def data_shape(data: Dict) -> str:
+    return _digest(sorted((path, type(value).__name__) for path, value in flatten_data(data).items()))
+
+
+def _is_flag(value) -> bool:
+    return isinstance(value, bool) or str(value).strip().lower() in _FLAG_VALUES
+
+
+def _derived_from_flag(mapping: FieldMapping, leaves: Dict[str, object]) -> bool:
+    # A checkbox rule's output computed from a flag-like value (for example "am not" from
+    # subject_to_restrictions). The flag is part of the variant key, so the literal is safe.
+    for _, label, path, transform in CHECKBOX_RULES:
+        source = ".".join(path)
+        if label == mapping.label and source in leaves and _is_flag(leaves[source]) \
+                and transform(leaves[source]) == mapping.value:
+            return True
+    return False
+
+
+class MappingCache:
+    """
+    On-disk cache of LLM mappings keyed by form structure and data shape.
+
+    Mappings are stored as templates: a value taken from the data becomes a slot pointing at
+    that field, and only flag values (or values a checkbox rule derives from a flag) are kept
+    literally; a mapping with any other value is not cached. The flag-like data values the
+    literals may depend on are part of the key, so a record only reuses a template when those
+    flags agree. When a value matches several fields (city and state both "New York"), the
+    slot takes one of them and the key records that the tied fields are equal.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 256,
+                 ttl_seconds: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: Dict[str, Dict] = {}
+        # Slot paths and tied path groups of the templates stored per base key, newest first.
+        self._layouts: Dict[str, List[Dict]] = {}
+        # Last field manifest seen per target URL, the baseline for incremental remapping.
+        self._forms: Dict[str, Dict] = {}
+        self._load()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+        }
+
+    def get(self, form_fp: str, data: Dict, count: bool = True) -> Optional[List[FieldMapping]]:
+        # count=False looks an entry up without touching the hit/miss counters or its LRU age.
+        base = self._base_key(form_fp, data)
+        leaves = flatten_data(data)
+        entry = None
+        for layout in self._layouts.get(base, []):
+            entry = self._entries.get(self._variant_key(base, leaves, layout))
+            if entry is not None:
+                break
+        if entry is None or self._expired(entry):
+            if count:
+                self.misses += 1
+            return None
+        if count:
+            entry["last_used"] = time.time()
+            self.hits += 1
+        return [self._render(slot, leaves) for slot in entry["template"]]
+
+    def put(self, form_fp: str, data: Dict, mappings: List[FieldMapping]) -> bool:
+        leaves = flatten_data(data)
+        template, ties = [], []
+        for mapping in mappings:
+            slot = self._make_slot(mapping, leaves)
+            if slot is None:
+                logger.info("ℹ️ [Cache] Value for '%s' does not come from the data; not caching.",
+                            mapping.label)
+                return False
+            tied = slot.pop("ties", None)
+            if tied and tied not in ties:
+                ties.append(tied)
+            template.append(slot)
+        layout = {"paths": sorted({slot["path"] for slot in template if "path" in slot}),
+                  "ties": sorted(ties)}
+        base = self._base_key(form_fp, data)
+        layouts = [other for other in self._layouts.get(base, []) if other != layout]
+        self._layouts[base] = [layout] + layouts[:_MAX_LAYOUTS - 1]
+        now = time.time()
+        self._entries[self._variant_key(base, leaves, layout)] = {
+            "base": base,
+            "form": form_fp,
+            "template": template,
+            "created": now,
+            "last_used": now,
+        }
+        self._evict()
+        self._save()
+        return True
+
+    def remember_form(self, url: str, manifest: List[Dict]):
+        form_fp = form_fingerprint(manifest)
+        if self._forms.get(url, {}).get("form") == form_fp:
+            return
+        self._forms[url] = {"form": form_fp, "manifest": manifest}
+        self._save()
+
+    def last_form(self, url: str) -> Optional[List[Dict]]:
+        form = self._forms.get(url)
+        return form["manifest"] if form else None
+
+    def invalidate(self, form_fp: Optional[str] = None) -> int:
+        removed = self._drop(lambda key, entry: form_fp is None or entry["form"] == form_fp)
+        self._layouts = {
+            base: layouts for base, layouts in self._layouts.items()
+            if any(entry["base"] == base for entry in self._entries.values())
+        }
+        self._save()
+        return removed
+
+    @staticmethod
+    def _base_key(form_fp: str, data: Dict) -> str:
+        return f"{form_fp}:{data_shape(data)}"
+
+    @staticmethod
+    def _variant_key(base: str, leaves: Dict[str, object], layout: Dict) -> str:
+        slotted = set(layout["paths"])
+        flags = {
+            path: str(value) for path, value in leaves.items()
+            if path not in slotted and _is_flag(value)
+        }
+        # A template built from tied fields is only valid while those fields stay equal.
+        equal = [len({str(leaves.get(path)) for path in group}) == 1 for group in layout["ties"]]
+        return f"{base}:{_digest([layout, flags, equal])}"
+
+    @staticmethod
+    def _make_slot(mapping: FieldMapping, leaves: Dict[str, object]) -> Optional[Dict]:
+        slot = {"section": mapping.section, "label": mapping.label}
+        if _is_flag(mapping.value) or _derived_from_flag(mapping, leaves):
+            slot["value"] = mapping.value
+            return slot
+        candidates = sorted(
+            path for path, value in leaves.items()
+            if not isinstance(value, bool) and str(value) == mapping.value
+        )
+        if not candidates:
+            # Reformatted or invented by the model: it may belong to this record only.
+            return None
+        scoped = [path for path in candidates if path.split(".")[0] == mapping.section]
+        candidates = scoped or candidates
+        slot["path"] = candidates[0]
+        if len(candidates) > 1:
+            slot["ties"] = candidates
+        return slot
+
+    @staticmethod
+    def _render(slot: Dict, leaves: Dict[str, object]) -> FieldMapping:
+        value = leaves.get(slot["path"], "") if "path" in slot else slot["value"]
+        return FieldMapping(section=slot["section"], label=slot["label"], value=value)
+
+    def _expired(self, entry: Dict) -> bool:
+        if self.ttl_seconds is None or time.time() - entry["created"] <= self.ttl_seconds:
+            return False
+        self._drop(lambda key, other: other is entry)
+        self.evictions += 1
+        return True
+
+    def _evict(self):
+        now = time.time()
+        if self.ttl_seconds is not None:
+            self.evictions += self._drop(lambda key, entry: now - entry["created"] > self.ttl_seconds)
+        overflow = len(self._entries) - self.max_entries
+        if overflow > 0:
+            oldest = sorted(self._entries, key=lambda key: self._entries[key]["last_used"])[:overflow]
+            self.evictions += self._drop(lambda key, entry: key in oldest)
+
+    def _drop(self, predicate) -> int:
+        doomed = [key for key, entry in self._entries.items() if predicate(key, entry)]
+        for key in doomed:
+            del self._entries[key]
+        return len(doomed)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                stored = json.load(fh)
+        except (OSError, ValueError) as e:
+            logger.warning("⚠️ [Cache] Ignoring unreadable mapping cache '%s': %s", self.path, e)
+            return
+        if stored.get("version") != CACHE_VERSION:
+            return
+        self._entries = stored.get("entries", {})
+        self._layouts = stored.get("layouts", {})
+        self._forms = stored.get("forms", {})
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump({
+                    "version": CACHE_VERSION,
+                    "entries": self._entries,
+                    "layouts": self._layouts,
+                    "forms": self._forms,
+                }, fh)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("⚠️ [Cache] Could not write mapping cache '%s': %s", self.path, e)
@@ -0,0 +1,131 @@
+from typing import Dict, List, Optional, Tuple
+
+from dom_index import DomIndex, normalize_label
+from field_mapping import FieldMapping
+from fill_plan import TRUTHY_VALUES
+from form_drift import field_key
+from static_fallbacks import STATIC_FIELDS
+
+SECTIONS = ("attorney", "client", "part6")
+
+# Checkbox values the fill plan understands: TRUTHY_VALUES check the box, these leave it clear.
+FALSY_VALUES = ["", "no", "false", "0", "off", "n"]
+LEGAL_FLAGS = set(TRUTHY_VALUES + FALSY_VALUES + ["y"])
+
+# Controls the LLM is not expected to map: the static fallbacks fill these from the record.
+STATIC_IDS = {selector.lstrip("#") for _, selector, _, _ in STATIC_FIELDS}
+
+# USD per million prompt / completion tokens; used only to report the cost of each tier.
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+}
+
+
+def _group_members(manifest: List[Dict], label: str) -> List[Dict]:
+    wanted = normalize_label(label)
+    members = []
+    for field in manifest:
+        group = normalize_label(field.get("group", ""))
+        if group and (group == wanted or group.startswith(wanted) or wanted.startswith(group)):
+            members.append(field)
+    return members
+
+
+def expected_fields(manifest: List[Dict]) -> List[Dict]:
+    # Fields a skipped answer should be escalated for: not static, and not a signature, which
+    # is left for a person to sign.
+    return [field for field in manifest
+            if field["id"] not in STATIC_IDS and "signature" not in normalize_label(field["label"])]
+
+
+def check_mapping(mapping: FieldMapping, manifest: List[Dict], index: DomIndex) -> Tuple[Optional[str], List[Dict]]:
+    """
+    Return (problem, targets): the reason the mapping cannot be filled as given (None when it
+    can) and the manifest fields it was meant for.
+    """
+    members = _group_members(manifest, mapping.label)
+    entry = None if members else index.lookup(mapping.label, mapping.section)
+    targets = members or ([entry] if entry else [])
+    if not targets:
+        return "unknown label", []
+    if mapping.section not in SECTIONS:
+        return f"unknown section '{mapping.section}'", targets
+    value = normalize_label(mapping.value)
+    if members:
+        if value and not any(value in normalize_label(field["label"]) for field in members):
+            return f"'{mapping.value}' matches no option of the group", targets
+    elif entry["type"] in ("checkbox", "radio"):
+        if value not in LEGAL_FLAGS:
+            return f"'{mapping.value}' is not a checkbox value", targets
+    elif entry["tag"] == "select":
+        if mapping.value and mapping.value not in entry.get("options", []):
+            return f"'{mapping.value}' is not an option", targets
+    return None, targets
+
+
+def validate_mappings(mappings: List[FieldMapping], manifest: List[Dict],
+                      require_all: bool = True) -> Dict:
+    """
+    Split a model's mappings into the ones that can be filled and the ones that cannot, and
+    list the manifest fields worth asking a stronger model about: targets of failed mappings
+    plus, with require_all, fields the model skipped that it was expected to map (see
+    expected_fields(); the rules have already taken their fields out of the manifest).
+    """
+    index = DomIndex(manifest)
+    valid, problems = [], []
+    covered, retry = set(), {}
+    for mapping in mappings:
+        problem, targets = check_mapping(mapping, manifest, index)
+        if problem is None:
+            valid.append(mapping)
+            covered.update(field_key(field) for field in targets)
+            continue
+        problems.append({"label": mapping.label, "value": mapping.value, "problem": problem})
+        for field in targets:
+            retry.setdefault(field_key(field), field)
+    missing = [field for field in expected_fields(manifest)
+               if field_key(field) not in covered and field_key(field) not in retry]
+    if require_all:
+        for field in missing:
+            retry[field_key(field)] = field
+    # A field a valid mapping already covers is not retried, even if another mapping for it failed.
+    retry_fields = [field for key, field in retry.items() if key not in covered]
+    return {"valid": valid, "problems": problems, "missing": len(missing), "retry_fields": retry_fields}
+
+
+class TierStats:
+    """Per-model counters for tuning the routing: how often each tier's answers held up, and at what cost."""
+
+    def __init__(self):
+        self.tiers: Dict[str, Dict] = {}
+
+    def record(self, tier: str, model: str, fields: int, mappings: int, valid: int, seconds: float,
+               usage: Dict[str, int]):
+        stats = self.tiers.setdefault(tier, {
+            "model": model, "calls": 0, "fields": 0, "mappings": 0, "valid": 0, "seconds": 0.0,
+            "prompt_tokens": 0, "completion_tokens": 0,
+        })
+        stats["calls"] += 1
+        stats["fields"] += fields
+        stats["mappings"] += mappings
+        stats["valid"] += valid
+        stats["seconds"] += seconds
+        stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        stats["completion_tokens"] += usage.get("completion_tokens", 0)
+
+    def report(self) -> Dict[str, Dict]:
+        report = {}
+        for tier, stats in self.tiers.items():
+            prompt_price, completion_price = MODEL_PRICES.get(stats["model"], (0.0, 0.0))
+            report[tier] = dict(
+                stats,
+                hit_rate=round(stats["valid"] / stats["mappings"], 3) if stats["mappings"] else None,
+                mean_seconds=round(stats["seconds"] / stats["calls"], 3) if stats["calls"] else None,
+                cost_usd=round((stats["prompt_tokens"] * prompt_price
+                                + stats["completion_tokens"] * completion_price) / 1e6, 6),
+            )
+        return report
@@ -0,0 +1,113 @@
+import weakref
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from instrumentation import tracer
+
+# Resource types filling never needs. Stylesheets only matter when someone watches the page.
+BLOCKED_RESOURCE_TYPES = ("image", "font", "media", "stylesheet")
+
+# Ready once the container exists and holds the expected controls (or any control if none are
+# expected). A fully loaded document that lacks some expected ids also counts as ready, so a
+# changed form is reported by the manifest check instead of timing out here.
+READY_SCRIPT = """
+({container, ids}) => {
+    const root = document.querySelector(container);
+    if (!root) {
+        return false;
+    }
+    if (!ids.length) {
+        return root.querySelector("input, select, textarea") !== null;
+    }
+    return ids.every((id) => document.getElementById(id) !== null) || document.readyState === "complete";
+}
+"""
+
+
+class ResponseCache:
+    """In-memory copy of the form document, served to every later navigation to the same URL."""
+
+    def __init__(self):
+        self._responses: Dict[str, Tuple[int, Dict[str, str], bytes]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def handle(self, route):
+        url = route.request.url
+        cached = self._responses.get(url)
+        if cached is not None:
+            self.hits += 1
+            tracer.count("navigate.cache_hit")
+            status, headers, body = cached
+            await route.fulfill(status=status, headers=headers, body=body)
+            return
+        self.misses += 1
+        tracer.count("navigate.cache_miss")
+        response = await route.fetch()
+        if response.status == 200:
+            self._responses[url] = (response.status, response.headers, await response.body())
+        await route.fulfill(response=response)
+
+
+class Navigator:
+    """
+    Opens the form page and waits on conditions only: the form container and the expected
+    controls. Request interception aborts the blocked resource types and, when a ResponseCache
+    is given, serves the form document from memory after the first fetch. A HAR file can replay
+    (or with har_update=True, record) the form page instead of fetching it.
+
+    Note that Playwright bypasses the browser's HTTP cache for routed pages, so interception is
+    only installed when something is blocked, cached or replayed.
+    """
+
+    def __init__(self, block_resources: Iterable[str] = BLOCKED_RESOURCE_TYPES,
+                 response_cache: Optional[ResponseCache] = None, har_path: Optional[str] = None,
+                 har_update: bool = False, container: str = ".form-container", timeout: float = 60000):
+        self.block_resources = frozenset(block_resources)
+        self.response_cache = response_cache
+        self.har_path = har_path
+        self.har_update = har_update
+        self.container = container
+        self.timeout = timeout
+        self.blocked = 0
+        self._prepared = weakref.WeakSet()
+        self._documents = set()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        stats = {"blocked": self.blocked}
+        if self.response_cache is not None:
+            stats.update(cache_hits=self.response_cache.hits, cache_misses=self.response_cache.misses)
+        return stats
+
+    async def _route(self, route):
+        request = route.request
+        if request.resource_type in self.block_resources:
+            self.blocked += 1
+            tracer.count("navigate.blocked")
+            await route.abort()
+        elif (self.response_cache is not None and request.resource_type == "document"
+              and request.url in self._documents):
+            await self.response_cache.handle(route)
+        else:
+            # Let the HAR router (if any) or the network handle it.
+            await route.fallback()
+
+    async def prepare(self, page):
+        # Routes are installed once per page; pooled pages keep them across records.
+        if page in self._prepared:
+            return
+        if self.har_path:
+            await page.route_from_har(self.har_path, not_found="fallback", update=self.har_update)
+        if self.block_resources or self.response_cache is not None:
+            await page.route("**/*", self._route)
+        self._prepared.add(page)
+
+    async def open(self, page, url: str, expected: Optional[List[Dict]] = None):
+        await self.prepare(page)
+        self._documents.add(url)
+        ids = sorted({field["id"] for field in expected or [] if field.get("id")})
+        with tracer.span("navigate.goto", url=url):
+            await page.goto(url, wait_until="commit", timeout=self.timeout)
+        with tracer.span("navigate.ready", controls=len(ids)):
+            await page.wait_for_function(READY_SCRIPT, arg={"container": self.container, "ids": ids},
+                                         timeout=self.timeout)
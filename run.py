@@ -1,14 +1,32 @@
+import argparse
 import asyncio
+import logging
 from form_filler import FormFiller
 from data import mock_data_all_fields
+from instrumentation import configure_logging, tracer
 
+logger = logging.getLogger(__name__)
 
-def run_tests():
+
+def run_tests(profile: str = None):
     test_name = "All Fields Data"
     filler = FormFiller("https://mendrika-alma.github.io/form-submission/", mock_data_all_fields)
-    print(f"\n================== Running Test Case: {test_name} ==================")
-    asyncio.run(filler.fill_form())
+    logger.info("\n================== Running Test Case: %s ==================", test_name)
+    if profile:
+        tracer.enable()
+    try:
+        asyncio.run(filler.fill_form())
+    finally:
+        if profile:
+            tracer.export(profile)
+            logger.info("🧾 Trace written to %s", profile)
 
 
 if __name__ == "__main__":
-    run_tests()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", metavar="PATH",
+                        help="record spans and token usage; .jsonl for JSON lines, otherwise a Chrome trace")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+    run_tests(args.profile)
@@ -1,108 +1,109 @@
+import logging
 from datetime import date
-from playwright.async_api import async_playwright
-from data import mock_data_all_fields
+from typing import Callable, Dict, List, Optional, Tuple
+from dom_index import DomIndex
+
+logger = logging.getLogger(__name__)
+
+UNIT_KINDS = ("apt", "ste", "flr")
+
+
+def _lookup(data: Dict, path: Tuple[str, ...]):
+    node = data
+    for key in path:
+        node = node.get(key) if isinstance(node, dict) else None
+    return node
+
+
+def _unit_of(section: str) -> Callable[[Dict], Dict]:
+    # The client uses the attorney's unit when it has none of its own. The record is only
+    # read, never updated.
+    def source(data: Dict) -> Dict:
+        unit = data.get(section) or {}
+        if section == "client" and not str(unit.get("unit_type", "")).strip():
+            unit = data.get("attorney") or {}
+        return unit
+    return source
+
+
+def _or_today(value) -> str:
+    return str(value or "").strip() or date.today().strftime("%m/%d/%Y")
+
+
+def _text(value) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _joined_info(entries) -> Optional[str]:
+    text = "\n".join(entry.get("additional_info", "") for entry in entries or [])
+    return text if text.strip() else None
+
+
+def _unit_checked(kind: str) -> Callable[[Dict], bool]:
+    def transform(unit: Dict) -> bool:
+        return str(unit.get("unit_type", "")).strip().lower() == kind
+    return transform
+
+
+def _unit_number(unit: Dict) -> Optional[str]:
+    number = str(unit.get("address_line_2", "")).strip()
+    if not number:
+        return None
+    try:
+        int(number)
+    except ValueError:
+        logger.warning("⚠️ [Static] Unit number '%s' is not a valid integer; skipping.", number)
+        return None
+    return number
+
+
+def _unit_fields(section: str, prefix: str) -> List[Tuple]:
+    rows = [("check", f"#{prefix}{kind}", _unit_of(section), _unit_checked(kind)) for kind in UNIT_KINDS]
+    rows.append(("field", f"#{prefix}apt-number", _unit_of(section), _unit_number))
+    return rows
+
+
+# Fields filled from the record without the LLM, one row per control:
+# (kind, selector, source, transform). The source is a data path or a function of the record;
+# the transform turns its value into the text to fill ("field") or the checked state ("check").
+# A transform returning None leaves the control alone.
+STATIC_FIELDS = [
+    ("field", "#client-signature-date", ("client", "signature_date"), _or_today),
+    ("field", "#attorney-signature-date", ("attorney_signature_date",), _or_today),
+    ("field", "#student-signature-date", ("additional_signature_date",), _or_today),
+    ("field", "#add-info-family-name", ("part6", "additional_info", "family_name"), _text),
+    ("field", "#add-info-given-name", ("part6", "additional_info", "given_name"), _text),
+    ("field", "#add-info-middle-name", ("part6", "additional_info", "middle_name"), _text),
+    ("field", "#add-info-text-2d", ("part6", "additional_info", "entries_section_2"), _joined_info),
+    ("field", "#add-info-text-3d", ("part6", "additional_info", "entries_section_3"), _joined_info),
+] + _unit_fields("attorney", "") + _unit_fields("client", "client-")
 
 
 class StaticFallbacks:
+    """
+    Turns STATIC_FIELDS into fill-plan operations for one record. Building the plan only reads
+    the record, so fillers running concurrently cannot affect each other. The operations run in
+    the same apply_plan() call as the LLM mappings.
+    """
+
+    def __init__(self, data: Dict, fields: List[Tuple] = None):
+        self.data = data
+        self.fields = STATIC_FIELDS if fields is None else fields
 
-    async def fill_signature_dates(self, page):
-        client_sig = mock_data_all_fields["client"].get("signature_date",
-                                                        "") or date.today().strftime("%m/%d/%Y")
-        attorney_sig = mock_data_all_fields.get("attorney_signature_date",
-                                                "") or date.today().strftime("%m/%d/%Y")
-        additional_sig = mock_data_all_fields.get("additional_signature_date",
-                                                  "") or date.today().strftime("%m/%d/%Y")
-        try:
-            await page.fill("#client-signature-date", client_sig)
-            await page.fill("#attorney-signature-date", attorney_sig)
-            await page.fill("#student-signature-date", additional_sig)
-            print(
-                f"✅ [Static] Filled signature dates: Client: {client_sig}, Attorney: {attorney_sig}, Student: {additional_sig}"
-            )
-        except Exception as e:
-            print("⚠️ [Static] Error filling signature dates:", e)
-
-    async def apply_part6(self, page):
-        try:
-            await page.fill("#add-info-family-name",
-                            mock_data_all_fields["part6"]["additional_info"]["family_name"])
-            await page.fill("#add-info-given-name",
-                            mock_data_all_fields["part6"]["additional_info"]["given_name"])
-            await page.fill("#add-info-middle-name",
-                            mock_data_all_fields["part6"]["additional_info"]["middle_name"])
-            print("✅ [Static] Filled Part 6 name fields")
-        except Exception as e:
-            print("⚠️ [Static] Error filling Part 6 name fields:", e)
-        entries_sec2 = mock_data_all_fields["part6"]["additional_info"].get("entries_section_2", [])
-        entries_sec3 = mock_data_all_fields["part6"]["additional_info"].get("entries_section_3", [])
-        text_sec2 = "\n".join(entry.get("additional_info", "") for entry in entries_sec2)
-        text_sec3 = "\n".join(entry.get("additional_info", "") for entry in entries_sec3)
-        try:
-            if text_sec2.strip():
-                await page.fill("#add-info-text-2d", text_sec2)
-                print("✅ [Static] Filled Part 6 additional info (section 2) with:", text_sec2)
-            if text_sec3.strip():
-                await page.fill("#add-info-text-3d", text_sec3)
-                print("✅ [Static] Filled Part 6 additional info (section 3) with:", text_sec3)
-        except Exception as e:
-            print("⚠️ [Static] Error filling Part 6 additional info:", e)
-
-    async def fill_unit_info(self, page, section: str):
-        if section == "attorney":
-            data = mock_data_all_fields["attorney"]
-            unit_value = data.get("unit_type", "").strip().lower()
-            number = data.get("address_line_2", "").strip()
-            selectors = {"apt": "#apt", "ste": "#ste", "flr": "#flr"}
-            desired = unit_value
-            for key, selector in selectors.items():
-                checkbox = page.locator(selector)
-                if key == desired:
-                    if not await checkbox.is_checked():
-                        await checkbox.check()
-                        print(f"✅ [Static] Checked '{key.upper()}' in attorney section")
-                else:
-                    if await checkbox.is_checked():
-                        await checkbox.uncheck()
-                        print(f"✅ [Static] Unchecked '{key.upper()}' in attorney section")
-            number_selector = "#apt-number"
-            if number:
-                try:
-                    int(number)
-                    await page.fill(number_selector, number)
-                    print(f"✅ [Static] Filled attorney unit number with '{number}'")
-                except ValueError:
-                    print(
-                        f"⚠️ [Static] Attorney unit number '{number}' is not a valid integer; skipping."
-                    )
-        elif section == "client":
-            data = mock_data_all_fields["client"]
-            if not data.get("unit_type", "").strip():
-                data["unit_type"] = mock_data_all_fields["attorney"].get("unit_type", "").strip()
-                data["address_line_2"] = mock_data_all_fields["attorney"].get("address_line_2",
-                                                                              "").strip()
-            unit_value = data.get("unit_type", "").strip().lower()
-            number = data.get("address_line_2", "").strip()
-            selectors = {"apt": "#client-apt", "ste": "#client-ste", "flr": "#client-flr"}
-            desired = unit_value
-            for key, selector in selectors.items():
-                checkbox = page.locator(selector)
-                if key == desired:
-                    if not await checkbox.is_checked():
-                        await checkbox.check()
-                        print(f"✅ [Static] Checked '{key.upper()}' in client section")
-                else:
-                    if await checkbox.is_checked():
-                        await checkbox.uncheck()
-                        print(f"✅ [Static] Unchecked '{key.upper()}' in client section")
-            number_selector = "#client-apt-number"
-            if number:
-                try:
-                    int(number)
-                    await page.fill(number_selector, number)
-                    print(f"✅ [Static] Filled client unit number with '{number}'")
-                except ValueError:
-                    print(
-                        f"⚠️ [Static] Client unit number '{number}' is not a valid integer; skipping."
-                    )
-        else:
-            print(f"⚠️ Unknown section '{section}' for unit info.")
+    def plan(self, index: Optional[DomIndex] = None) -> List[Dict]:
+        ops = []
+        for kind, selector, source, transform in self.fields:
+            value = transform(source(self.data) if callable(source) else _lookup(self.data, source))
+            if value is None:
+                continue
+            # Without an index every selector is attempted; with one, absent controls are
+            # dropped here instead of reported as not_found by the page.
+            if index is not None and not index.has(selector):
+                logger.warning("⚠️ [Static] '%s' is not on the page; skipping.", selector)
+                continue
+            if kind == "check":
+                ops.append({"kind": "check", "label": selector, "selector": selector, "checked": value})
+            else:
+                ops.append({"kind": "field", "label": selector, "selector": selector, "value": value})
+        logger.debug("✅ [Static] Planned %s static operations", len(ops))
+        return ops
@@ -0,0 +1,59 @@
+import json
+
+from llm_mapper import JSONArrayStreamParser
+
+
+def feed_all(text, size):
+    parser = JSONArrayStreamParser()
+    objects = []
+    for i in range(0, len(text), size):
+        objects += parser.feed(text[i:i + size])
+    return parser, objects
+
+
+ITEMS = [
+    {"section": "attorney", "label": "Name \"as written\"", "value": "C:\\path\\to"},
+    {"section": "client", "label": "Notes", "value": "closing ]} inside [{ a string"},
+]
+
+
+def test_objects_split_at_every_position():
+    text = "Here you go:\n```json\n" + json.dumps(ITEMS) + "\n```"
+    for size in (1, 2, 3, 5, 8, len(text)):
+        parser, objects = feed_all(text, size)
+        assert objects == ITEMS
+        assert parser.started and parser.finished and not parser.malformed and parser.trailing == ""
+
+
+def test_chunk_boundary_right_after_a_backslash():
+    text = '[{"label": "a\\\\", "value": "b\\"]"}]'
+    parser = JSONArrayStreamParser()
+    boundary = text.index("\\") + 1
+    objects = parser.feed(text[:boundary]) + parser.feed(text[boundary:])
+    assert objects == [{"label": "a\\", "value": 'b"]'}]
+    assert parser.finished
+
+
+def test_malformed_object_between_valid_ones():
+    parser, objects = feed_all('[{"value": 1}, {"value": 2,}, {"value": 3}]', 4)
+    assert objects == [{"value": 1}, {"value": 3}]
+    assert parser.malformed == ['{"value": 2,}']
+    assert parser.finished
+
+
+def test_truncated_tail_is_reported():
+    parser, objects = feed_all('[{"value": 1}, {"value": "unfinished', 6)
+    assert objects == [{"value": 1}]
+    assert parser.trailing == '{"value": "unfinished'
+    assert not parser.finished
+
+
+def test_text_after_the_array_is_ignored():
+    parser, objects = feed_all('[{"value": 1}] and then {"value": 2}', 3)
+    assert objects == [{"value": 1}]
+    assert parser.finished
+
+
+def test_output_without_an_array():
+    parser, objects = feed_all("I am not able to map these fields.", 4)
+    assert objects == [] and not parser.started
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from llm_client import DeadlineExceeded, LLMClient, TokenBucket
+from llm_stub_server import StubState, serve_stub
+
+RESPONSES = {"form": [{"section": "attorney", "label": "Family Name", "value": "Smith"}]}
+
+
+class _Message:
+
+    def __init__(self, content):
+        self.content = content
+
+
+class StubError(Exception):
+    """An HTTP error shaped like the provider SDK's: a status code and the response headers."""
+
+    def __init__(self, error: urllib.error.HTTPError):
+        super().__init__(f"HTTP {error.code}")
+        self.status_code = error.code
+        self.response = error
+
+
+class StubModel:
+    """A chat model calling the stub's /chat/completions endpoint without the provider SDK."""
+
+    def __init__(self, base_url):
+        self.url = f"{base_url}/chat/completions"
+
+    def _post(self, messages):
+        body = json.dumps({"model": "stub", "messages": [{"role": "user", "content": m.content} for m in messages]})
+        request = urllib.request.Request(self.url, body.encode("utf-8"), {"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return json.load(response)["choices"][0]["message"]["content"]
+        except urllib.error.HTTPError as e:
+            e.read()
+            raise StubError(e) from None
+
+    async def ainvoke(self, messages):
+        return _Message(await asyncio.to_thread(self._post, messages))
+
+
+def test_client_retries_errors_and_stops_at_a_retry_after_past_the_deadline():
+    random.seed(2)  # the stub draws its errors from the same generator: one 503, two answers
+    state = StubState(RESPONSES, requests_per_minute=3, latency=0, error_rate=0.5)
+    client = LLMClient(max_retries=10, base_delay=0.01, deadline=5)
+
+    async def run():
+        answers = []
+        with pytest.raises(DeadlineExceeded):
+            while True:
+                answers.append(await client.ainvoke(StubModel(base_url), [_Message("map the form")]))
+        return answers
+
+    with serve_stub(state) as base_url:
+        started = time.monotonic()
+        answers = asyncio.run(run())
+        elapsed = time.monotonic() - started
+
+    # Three requests fit the stub's window: the 503s among them were retried, the rest answered.
+    assert len(answers) == state.counters["served"] == 2
+    assert state.counters["served"] + state.counters["errors"] == 3
+    assert all(json.loads(answer.content) == RESPONSES["form"] for answer in answers)
+    assert client.counters["retries"] == state.counters["errors"] > 0
+    # The fourth was throttled with a Retry-After of about a minute, which the 5s deadline
+    # cannot cover, so the client gave up at once instead of retrying sooner.
+    assert client.counters["rate_limited"] == state.counters["rate_limited"] == 1
+    assert client.counters["failures"] == 1
+    assert elapsed < 5
+
+
+def test_retry_after_sets_the_minimum_backoff():
+    error = StubError(urllib.error.HTTPError("http://stub", 429, "Too Many Requests", {"retry-after": "2.5"}, None))
+    client = LLMClient(base_delay=0.01)
+    assert all(client._backoff(attempt, error) == 2.5 for attempt in range(3))
+
+
+def test_bucket_waits_once_the_capacity_is_used():
+    bucket = TokenBucket(600, capacity=2)
+
+    async def run():
+        await bucket.acquire(2)
+        assert bucket.waits == 0
+        started = time.monotonic()
+        await bucket.acquire(1)
+        return time.monotonic() - started
+
+    assert 0.05 < asyncio.run(run()) < 0.5
+    assert bucket.waits == 1 and bucket.wait_seconds == pytest.approx(0.1, abs=0.02)
+
+
+def test_bucket_settles_the_actual_amount():
+    bucket = TokenBucket(60, capacity=100)
+    asyncio.run(bucket.acquire(50))
+    bucket.settle(50, 80)
+    assert bucket.stats["available"] == pytest.approx(20, abs=1)
+    bucket.settle(0, 70)
+    assert bucket.stats["available"] < 0
+
+
+def test_bucket_caps_oversized_requests_at_the_capacity():
+    bucket = TokenBucket(6000, capacity=10)
+    asyncio.run(asyncio.wait_for(bucket.acquire(1000), 1))
+    assert bucket.waits == 0
@@ -0,0 +1,222 @@
+import asyncio
+import json
+
+import pytest
+
+from checkbox_rules import CHECKBOX_RULES
+from data import mock_data_all_fields
+from form_filler import FormFiller
+from form_manifest import manifest_to_prompt
+from llm_client import LLMClient
+from llm_mapper import LLMMapper, MappingFailed
+from mapping_cache import MappingCache
+
+
+class NoCallMapper(LLMMapper):
+
+    def _chat_model(self, model_name=None):
+        raise AssertionError("the model should not be called")
+
+
+class _Message:
+
+    def __init__(self, content):
+        self.content = content
+
+
+class ScriptedModel:
+    """Answers every call with the same text and records the prompts it was sent."""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.prompts = []
+
+    async def ainvoke(self, messages):
+        self.prompts.append(messages[-1].content)
+        return _Message(self.answer)
+
+    async def astream(self, messages):
+        self.prompts.append(messages[-1].content)
+        for i in range(0, len(self.answer), 7):
+            yield _Message(self.answer[i:i + 7])
+
+
+class ScriptedMapper(LLMMapper):
+
+    def __init__(self, answers, **kwargs):
+        super().__init__(client=LLMClient(), **kwargs)
+        self.models = {name: ScriptedModel(answer) for name, answer in answers.items()}
+
+    def _build_messages(self, manifest, data, section=None):
+        return [_Message(manifest_to_prompt(manifest))]
+
+    def _chat_model(self, model_name=None):
+        return self.models[model_name or self.model_name]
+
+
+def checkbox(label):
+    return {"section": "Part 1", "label": label, "id": "", "name": "", "tag": "input", "type": "checkbox"}
+
+
+def text_field(label, control_id):
+    return {"section": "Part 1. Information About Attorney", "label": label, "id": control_id, "name": "",
+            "tag": "input", "type": "text"}
+
+
+MANIFEST = [
+    checkbox("1.c. I (select only one box)"),
+    text_field("Family Name", "family-name"),
+    text_field("City or Town", "city"),
+]
+
+ANSWER = json.dumps([
+    {"section": "attorney", "label": "Family Name", "value": "Smith"},
+    {"section": "attorney", "label": "City or Town", "value": "New York"},
+])
+
+
+def test_rules_covering_every_field_skip_the_model():
+    manifest = [checkbox(label) for _, label, _, _ in CHECKBOX_RULES[:3]]
+    mappings = asyncio.run(NoCallMapper().get_mapping(manifest, mock_data_all_fields))
+    assert [mapping.label for mapping in mappings] == [label for _, label, _, _ in CHECKBOX_RULES[:3]]
+
+
+def test_rules_for_fields_missing_from_the_form_are_not_emitted():
+    manifest = [dict(checkbox("am"), group="1.c. I (select only one box)"), text_field("Family Name", "family-name")]
+    mapper = ScriptedMapper({"gpt-4o": ANSWER})
+    mappings = asyncio.run(mapper.get_mapping(manifest, mock_data_all_fields))
+    rule_labels = {label for _, label, _, _ in CHECKBOX_RULES}
+    assert [mapping.label for mapping in mappings if mapping.label in rule_labels] == ["1.c. I (select only one box)"]
+    assert "I (select only one box)" not in mapper.models["gpt-4o"].prompts[0]
+
+
+def test_incremental_remap_of_rule_fields_skips_the_model():
+    previous = [checkbox("1.c. I (select only one box)")]
+    current = [checkbox("1.c. I (select only one box)"), checkbox("2.a. Civil Case")]
+    mapper = NoCallMapper()
+    asyncio.run(mapper.get_incremental_mapping(current, mock_data_all_fields, previous, [], max_drift=1.0))
+    assert mapper.last_drift_report["remapped_fields"] == 1
+
+
+def test_unparsable_answer_raises_with_the_rule_mappings():
+    mapper = ScriptedMapper({"gpt-4o": "Sorry, I cannot help with that."})
+    with pytest.raises(MappingFailed) as failed:
+        asyncio.run(mapper.get_mapping(MANIFEST, mock_data_all_fields))
+    assert "1.c. I (select only one box)" in [mapping.label for mapping in failed.value.partial]
+
+
+def test_failed_mapping_is_filled_but_not_cached():
+    cache = MappingCache(path=None)
+    mapper = ScriptedMapper({"gpt-4o": "no JSON here"})
+    filler = FormFiller("http://form", mock_data_all_fields, cache=cache, mapper=mapper)
+    mappings = asyncio.run(filler.map_fields(MANIFEST))
+    assert mappings and filler.mapping_error
+    assert cache.stats["entries"] == 0
+
+
+def test_good_answer_is_cached():
+    cache = MappingCache(path=None)
+    filler = FormFiller("http://form", mock_data_all_fields, cache=cache,
+                        mapper=ScriptedMapper({"gpt-4o": ANSWER}))
+    asyncio.run(filler.map_fields(MANIFEST))
+    assert filler.mapping_error is None
+    assert cache.stats["entries"] == 1
+
+
+def test_fast_model_prose_escalates_the_whole_manifest():
+    mapper = ScriptedMapper({"mini": "I think the family name is Smith.", "gpt-4o": ANSWER}, fast_model="mini")
+    mappings = asyncio.run(mapper.get_mapping(MANIFEST, mock_data_all_fields))
+    assert len(mapper.models["gpt-4o"].prompts) == 1
+    assert "Family Name" in mapper.models["gpt-4o"].prompts[0]
+    assert {"Family Name", "City or Town"} <= {mapping.label for mapping in mappings}
+
+
+def test_fields_the_fast_model_skipped_are_escalated():
+    partial = json.dumps([{"section": "attorney", "label": "Family Name", "value": "Smith"}])
+    mapper = ScriptedMapper({"mini": partial, "gpt-4o": ANSWER}, fast_model="mini")
+    asyncio.run(mapper.get_mapping(MANIFEST, mock_data_all_fields))
+    prompt = mapper.models["gpt-4o"].prompts[0]
+    assert "City or Town" in prompt and "Family Name" not in prompt
+
+
+def test_both_tiers_failing_raises():
+    mapper = ScriptedMapper({"mini": "[]", "gpt-4o": "no idea"}, fast_model="mini")
+    with pytest.raises(MappingFailed):
+        asyncio.run(mapper.get_mapping(MANIFEST, mock_data_all_fields))
+
+
+def stream_into_cache(answer):
+    cache = MappingCache(path=None)
+    filler = FormFiller("http://form", mock_data_all_fields, cache=cache,
+                        mapper=ScriptedMapper({"gpt-4o": answer}), streaming=True)
+
+    async def run():
+        queue = asyncio.Queue()
+        await filler.produce_mappings(MANIFEST, queue)
+        streamed = []
+        while (mapping := queue.get_nowait()) is not None:
+            streamed.append(mapping)
+        return streamed
+
+    return filler, cache, asyncio.run(run())
+
+
+def test_stream_without_a_json_array_is_not_cached():
+    filler, cache, streamed = stream_into_cache("I could not find the fields.")
+    assert streamed and filler.mapping_error
+    assert cache.stats["entries"] == 0
+
+
+def test_complete_stream_is_cached():
+    filler, cache, streamed = stream_into_cache(ANSWER)
+    assert filler.mapping_error is None
+    assert cache.stats["entries"] == 1
+
+
+class SectionModel(ScriptedModel):
+    """Answers the attorney section and fails the client section."""
+
+    async def ainvoke(self, messages):
+        prompt = messages[-1].content
+        self.prompts.append(prompt)
+        return _Message(ANSWER if "Family Name" in prompt else "Something went wrong.")
+
+
+def test_section_failure_is_filled_but_not_cached():
+    manifest = MANIFEST + [dict(text_field("Client Email", "client-email"), section="Part 3. Client")]
+    mapper = ScriptedMapper({})
+    mapper.models["gpt-4o"] = SectionModel(None)
+    cache = MappingCache(path=None)
+    filler = FormFiller("http://form", mock_data_all_fields, cache=cache, mapper=mapper, section_parallel=True)
+    mappings = asyncio.run(filler.map_fields(manifest))
+    assert "Family Name" in {mapping.label for mapping in mappings}
+    assert "client" in filler.mapping_error
+    assert cache.stats["entries"] == 0
+
+
+class BlockingModel(ScriptedModel):
+    """Never answers, so the mapping task is still running when the page fails."""
+
+    async def ainvoke(self, messages):
+        self.prompts.append(messages[-1].content)
+        await asyncio.Event().wait()
+
+
+class BrokenPageFiller(FormFiller):
+
+    async def open(self, page, expected_manifest=None):
+        raise RuntimeError("navigation failed")
+
+
+def test_failed_navigation_cancels_the_mapping():
+    mapper = ScriptedMapper({})
+    mapper.models["gpt-4o"] = BlockingModel(None)
+    filler = BrokenPageFiller("http://form", mock_data_all_fields, cache=MappingCache(path=None), mapper=mapper)
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await filler.fill_page(None, MANIFEST)
+        await asyncio.sleep(0)
+        return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    assert asyncio.run(run()) == []
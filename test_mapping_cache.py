@@ -0,0 +1,93 @@
+import copy
+
+from data import mock_data_all_fields
+from field_mapping import FieldMapping
+from mapping_cache import MappingCache
+
+FORM = "form-fp"
+
+
+def record(**attorney):
+    data = copy.deepcopy(mock_data_all_fields)
+    data["attorney"].update(attorney)
+    return data
+
+
+def mappings_for(data):
+    attorney = data["attorney"]
+    return [
+        FieldMapping(section="attorney", label="Family Name", value=attorney["family_name"]),
+        FieldMapping(section="attorney", label="City or Town", value=attorney["city"]),
+        FieldMapping(section="attorney", label="State", value=attorney["state"]),
+        FieldMapping(section="attorney", label="Name of Law Firm", value=attorney["law_firm"]),
+        FieldMapping(section="attorney", label="Recognized Organization", value=attorney["recognized_org"]),
+        FieldMapping(section="attorney", label="1.c. I (select only one box)", value="am"),
+        FieldMapping(section="attorney", label="2.a. Civil Case", value="yes"),
+    ]
+
+
+def values(mappings):
+    return {mapping.label: mapping.value for mapping in mappings}
+
+
+def test_slots_render_the_new_record():
+    cache = MappingCache(path=None)
+    first = record(city="Boston", state="MA")
+    assert cache.put(FORM, first, mappings_for(first))
+    second = record(family_name="Jones", city="Austin", state="TX")
+    assert values(cache.get(FORM, second)) == values(mappings_for(second))
+    assert cache.stats["hits"] == 1
+
+
+def test_sample_record_with_tied_values_is_cached():
+    # city == state and law_firm == recognized_org in the sample data.
+    cache = MappingCache(path=None)
+    assert cache.put(FORM, mock_data_all_fields, mappings_for(mock_data_all_fields))
+    assert cache.stats["entries"] == 1
+    same_ties = record(family_name="Jones", city="Texas", state="Texas")
+    assert values(cache.get(FORM, same_ties)) == values(mappings_for(same_ties))
+
+
+def test_tied_template_is_not_used_when_the_values_differ():
+    cache = MappingCache(path=None)
+    assert cache.put(FORM, mock_data_all_fields, mappings_for(mock_data_all_fields))
+    assert cache.get(FORM, record(city="Buffalo")) is None
+    untied = record(city="Buffalo", law_firm="Firm LLP", recognized_org="Org Inc")
+    assert cache.put(FORM, untied, mappings_for(untied))
+    # Both layouts are kept, so neither record evicts the other.
+    assert values(cache.get(FORM, record(city="Albany"))) == values(mappings_for(record(city="Albany")))
+    assert cache.get(FORM, mock_data_all_fields) is not None
+
+
+def test_reformatted_value_is_not_cached():
+    cache = MappingCache(path=None)
+    data = record(city="Boston", state="MA")
+    mappings = mappings_for(data) + [
+        FieldMapping(section="client", label="Daytime Telephone Number", value="(646) 555-3333"),
+    ]
+    assert not cache.put(FORM, data, mappings)
+    assert cache.get(FORM, record(city="Austin", state="TX")) is None
+
+
+def test_flag_changes_select_another_variant():
+    cache = MappingCache(path=None)
+    data = record(city="Boston", state="MA")
+    assert cache.put(FORM, data, mappings_for(data))
+    assert cache.get(FORM, record(city="Austin", state="TX", subject_to_restrictions="no")) is None
+
+
+def test_entries_survive_a_reload(tmp_path):
+    path = str(tmp_path / "cache.json")
+    data = record(city="Boston", state="MA")
+    assert MappingCache(path=path).put(FORM, data, mappings_for(data))
+    reloaded = MappingCache(path=path)
+    assert values(reloaded.get(FORM, data)) == values(mappings_for(data))
+
+
+def test_uncounted_lookup_leaves_stats_alone():
+    cache = MappingCache(path=None)
+    data = record(city="Boston", state="MA")
+    assert cache.get(FORM, data, count=False) is None
+    assert cache.put(FORM, data, mappings_for(data))
+    assert cache.get(FORM, data, count=False) is not None
+    assert (cache.stats["hits"], cache.stats["misses"]) == (0, 0)
@@ -0,0 +1,56 @@
+import asyncio
+
+from fill_plan import APPLIED, APPLY_PLAN_SCRIPT, NOT_FOUND, SKIPPED
+from verification import verify_and_retry, verifiable
+
+
+class FakePage:
+    """Text inputs keyed by id; applying a plan sets their values in plan order."""
+
+    def __init__(self, values):
+        self.values = dict(values)
+        self.applied = []
+
+    @staticmethod
+    def _id(selector):
+        return selector.lstrip("#").replace('[id="', "").rstrip('"]')
+
+    async def evaluate(self, script, ops):
+        if script == APPLY_PLAN_SCRIPT:
+            self.applied.extend(ops)
+            for op in ops:
+                self.values[self._id(op["selector"])] = op["value"]
+            return [{"label": op["label"], "status": APPLIED, "detail": ""} for op in ops]
+        return [{"found": True, "tag": "input", "type": "text", "value": self.values[self._id(op["selector"])]}
+                for op in ops]
+
+
+def field(selector, value):
+    return {"kind": "field", "label": selector, "selector": selector, "value": value}
+
+
+def applied(plan):
+    return [{"label": op["label"], "status": APPLIED, "detail": ""} for op in plan]
+
+
+def test_only_the_last_op_for_a_control_is_verified():
+    plan = [field('[id="client-signature-date"]', "01/01/2024"), field("#client-signature-date", "02/02/2024")]
+    assert verifiable(plan, applied(plan)) == [plan[1]]
+
+
+def test_overwritten_llm_value_is_not_retried():
+    plan = [field('[id="client-signature-date"]', "01/01/2024"), field("#client-signature-date", "02/02/2024")]
+    page = FakePage({"client-signature-date": "02/02/2024"})
+    report = asyncio.run(verify_and_retry(page, plan, applied(plan)))
+    assert report["complete"] and report["attempts"] == 0
+    assert page.values["client-signature-date"] == "02/02/2024"
+
+
+def test_unapplied_ops_make_the_record_incomplete():
+    plan = [field("#family-name", "Smith"), field("#city", "Boston"),
+            {"kind": "skip", "label": "Date", "value": ""}]
+    results = applied(plan[:1]) + [{"label": "#city", "status": NOT_FOUND, "detail": ""},
+                                   {"label": "Date", "status": SKIPPED, "detail": ""}]
+    report = asyncio.run(verify_and_retry(FakePage({"family-name": "Smith"}), plan, results))
+    assert report["failed"] == [] and report["unapplied"] == 1
+    assert not report["complete"]
@@ -0,0 +1,159 @@
+import logging
+import re
+from typing import Dict, List, Optional
+
+from fill_plan import APPLIED, LOCAL_KINDS, SKIPPED, TRUTHY_VALUES, apply_plan
+from instrumentation import tracer
+
+logger = logging.getLogger(__name__)
+
+# Reads back the state of every planned control in one page.evaluate() call. The timeout tick
+# lets change handlers that defer their work finish before anything is read.
+READ_BACK_SCRIPT = """
+async (ops) => {
+    await new Promise((resolve) => setTimeout(resolve, 0));
+    const norm = (s) => (s || "").replace(/\\s+/g, " ").trim().toLowerCase();
+    const labelFor = (el) => {
+        const label = el.id ? document.querySelector(`label[for="${CSS.escape(el.id)}"]`) : null;
+        return norm(label ? label.textContent : "");
+    };
+    return ops.map((op) => {
+        if (op.kind === "choice") {
+            const boxes = Array.from(document.querySelectorAll(`input[name="${op.name}"]`));
+            return {found: boxes.length > 0, checked: boxes.filter((b) => b.checked).map(labelFor)};
+        }
+        const el = op.selector ? document.querySelector(op.selector) : null;
+        if (!el) {
+            return {found: false};
+        }
+        return {
+            found: true,
+            tag: el.tagName.toLowerCase(),
+            type: (el.getAttribute("type") || "").toLowerCase(),
+            value: el.value,
+            checked: !!el.checked,
+        };
+    });
+}
+"""
+
+
+def _norm(text) -> str:
+    return " ".join(str(text or "").split()).lower()
+
+
+def expected_state(op: Dict, state: Dict):
+    # What the control should read back as, in the same shape matches() compares.
+    if op["kind"] == "choice":
+        return _norm(op["value"])
+    if op["kind"] == "check":
+        return op["checked"]
+    if state.get("type") in ("checkbox", "radio"):
+        return _norm(op["value"]) in TRUTHY_VALUES
+    return _norm(op["value"])
+
+
+def actual_state(op: Dict, state: Dict):
+    if not state.get("found"):
+        return None
+    if op["kind"] == "choice":
+        return state["checked"]
+    if op["kind"] == "check" or state.get("type") in ("checkbox", "radio"):
+        return state["checked"]
+    return _norm(state["value"])
+
+
+def matches(op: Dict, state: Dict) -> bool:
+    if not state.get("found"):
+        return False
+    if op["kind"] == "choice":
+        wanted = _norm(op["value"])
+        if not wanted:
+            return not state["checked"]
+        return bool(state["checked"]) and all(wanted in label for label in state["checked"])
+    return actual_state(op, state) == expected_state(op, state)
+
+
+def _control_key(op: Dict):
+    # The same control may be addressed as "#id" (static fallbacks) or '[id="id"]' (DOM index).
+    if op["kind"] == "choice":
+        return "name", op["name"]
+    match = re.fullmatch(r'#([\w-]+)|\[id="([^"]+)"\]', op["selector"])
+    return ("id", match.group(1) or match.group(2)) if match else ("selector", op["selector"])
+
+
+def verifiable(plan: List[Dict], results: Optional[List[Dict]] = None) -> List[Dict]:
+    """
+    The plan operations worth reading back: located by selector or checkbox name, the last one
+    for each control (later operations, such as the static fallbacks, overwrite earlier ones),
+    and (when fill results are given, aligned with the plan) reported as applied. Operations
+    that were not found or rejected cannot be fixed by a retry.
+    """
+    winners = {}
+    for position, op in enumerate(plan):
+        if op["kind"] in LOCAL_KINDS or not (op.get("selector") or op["kind"] == "choice"):
+            continue
+        winners[_control_key(op)] = position
+    ops = []
+    for position in sorted(winners.values()):
+        if results is not None and results[position]["status"] != APPLIED:
+            continue
+        ops.append(plan[position])
+    return ops
+
+
+def unapplied(plan: List[Dict], results: Optional[List[Dict]] = None) -> int:
+    # Operations that never reached their control; a record with any of them is not complete.
+    if results is not None:
+        return sum(1 for result in results if result["status"] not in (APPLIED, SKIPPED))
+    return sum(1 for op in plan if op["kind"] in ("reject", "missing"))
+
+
+async def read_back(page, ops: List[Dict]) -> List[Dict]:
+    return await page.evaluate(READ_BACK_SCRIPT, ops) if ops else []
+
+
+@tracer.traced("verify", lambda page, plan, results=None, retries=2: {"ops": len(plan)})
+async def verify_and_retry(page, plan: List[Dict], results: Optional[List[Dict]] = None,
+                           retries: int = 2) -> Dict:
+    """
+    Read back every verifiable operation of the plan, re-apply only the ones whose control does
+    not hold the intended state, and repeat for at most `retries` rounds. Returns a
+    completeness report for the record.
+    """
+    ops = verifiable(plan, results)
+    states = await read_back(page, ops)
+    failing = [(op, state) for op, state in zip(ops, states) if not matches(op, state)]
+    initially_failing = len(failing)
+    attempts = 0
+    while failing and attempts < retries:
+        attempts += 1
+        tracer.count("verify.retried", len(failing))
+        logger.info("🔁 Retrying %s field(s) that did not hold their value (attempt %s/%s)",
+                    len(failing), attempts, retries)
+        retry_ops = [op for op, _ in failing]
+        await apply_plan(page, retry_ops)
+        states = await read_back(page, retry_ops)
+        failing = [(op, state) for op, state in zip(retry_ops, states) if not matches(op, state)]
+    tracer.count("verify.recovered", initially_failing - len(failing))
+    not_applied = unapplied(plan, results)
+    failures = [{
+        "label": op["label"],
+        "selector": op.get("selector") or f"input[name=\"{op['name']}\"]",
+        "expected": expected_state(op, state),
+        "actual": actual_state(op, state),
+    } for op, state in failing]
+    for failure in failures:
+        logger.warning("⚠️ [Verify] '%s' expected %r, found %r",
+                       failure["label"], failure["expected"], failure["actual"])
+    return {
+        "planned": len(plan),
+        "verified": len(ops),
+        "mismatched": initially_failing,
+        "recovered": initially_failing - len(failures),
+        "attempts": attempts,
+        "failed": failures,
+        "not_verified": len(plan) - len(ops),
+        "unapplied": not_applied,
+        "complete": not failures and not not_applied,
+    }